@@ -0,0 +1,251 @@
+#!/usr/bin/env python3
+import os
+import sys
+import json
+from perfmon import PerfMon
+
+CUR_DIR = os.path.abspath(os.path.dirname(__file__))
+
+'''
+# CAMPAIGN FILE
+- A campaign is a list of runs in a JSON file (or a TOML file with
+  [[runs]] tables if tomllib is available). Each run becomes a Runner.
+  {"runs": [
+      {"core_grain":"fine",
+       "perfmon_level":"LOW",
+       "filter":["mem", "*", "*", "*", "*"],
+       "media":["mem"],
+       "fs":["ext4", "xfs"],
+       "bench":["DWOL", "MWCM"],
+       "ncore":[1, 2, 4],
+       "directio":["bufferedio"],
+       "duration":30,
+       "warmup":0,
+       "repetitions":1,
+       "runner":{"MOUNT_REUSE":true}}
+  ]}
+- Every key is optional:
+  - core_grain:    fine | coarse (default: coarse)
+  - perfmon_level: name of PerfMon.LEVEL_* without the prefix
+  - filter:        (media, fs, bench, ncore, directio), "*" matches all
+  - ncore:         default: all core counts of core_grain
+  - runner:        any other Runner attribute (e.g., CPU_RESTRICT)
+'''
+
+class Campaign(object):
+    RUN_ATTRS = {
+        "media":"MEDIA_TYPES",
+        "fs":"FS_TYPES",
+        "bench":"BENCH_TYPES",
+        "directio":"DIRECTIOS",
+        "duration":"DURATION",
+        "warmup":"WARMUP",
+        "repetitions":"REPETITIONS",
+    }
+    RUN_KEYS = set(RUN_ATTRS) | set(["core_grain", "perfmon_level",
+                                     "filter", "ncore", "runner"])
+    # Runner attributes that a config itself reflects, bookkeeping,
+    # and method tables
+    NOT_DUP_ATTRS = set(["MEDIA_TYPES", "FS_TYPES", "BENCH_TYPES",
+                         "DIRECTIOS", "CORE_GRAIN", "FILTER", "SKIP_CONFIG",
+                         "RESUME_DIR", "RUN_INDEX", "DRYRUN",
+                         "HOWTO_INIT_MEDIA", "HOWTO_MOUNT"])
+
+    def __init__(self, path):
+        self.path = path
+        self.runs = self._load(path)
+
+    def _load(self, path):
+        if path.endswith(".toml"):
+            import tomllib
+            with open(path, "rb") as fd:
+                campaign = tomllib.load(fd)
+        else:
+            with open(path) as fd:
+                campaign = json.load(fd)
+        runs = campaign.get("runs", [])
+        for run in runs:
+            unknown = set(run) - Campaign.RUN_KEYS
+            if unknown:
+                raise ValueError("%s: unknown keys: %s" %
+                                 (path, ','.join(sorted(unknown))))
+        return runs
+
+    def gen_runners(self, runner_cls):
+        for run in self.runs:
+            yield self._make_runner(runner_cls, run)
+
+    def _make_runner(self, runner_cls, run):
+        core_grain = {
+            "fine":runner_cls.CORE_FINE_GRAIN,
+            "coarse":runner_cls.CORE_COARSE_GRAIN,
+        }[run.get("core_grain", "coarse")]
+        pfm_lvl = getattr(PerfMon, "LEVEL_" + run.get("perfmon_level", "LOW"))
+        run_filter = tuple(run.get("filter", ("*", "*", "*", "*", "*")))
+        runner = runner_cls(core_grain, pfm_lvl, run_filter)
+        for (key, attr) in Campaign.RUN_ATTRS.items():
+            if key in run:
+                setattr(runner, attr, run[key])
+        if "ncore" in run:
+            runner.ncores = sorted(set(run["ncore"]))
+        for (attr, val) in run.get("runner", {}).items():
+            if not hasattr(runner, attr):
+                raise ValueError("%s: unknown Runner attribute: %s" %
+                                 (self.path, attr))
+            setattr(runner, attr, val)
+        return runner
+
+    @staticmethod
+    def run_settings(runner):
+        # every setting a campaign can change, e.g., REPETITIONS,
+        # PERFMON_LEVEL, or CPU_RESTRICT and MKFS_CACHE of "runner"
+        return tuple(sorted((attr, repr(val))
+                            for (attr, val) in vars(runner).items()
+                            if attr.isupper() and
+                            attr not in Campaign.NOT_DUP_ATTRS))
+
+    @staticmethod
+    def remove_duplicates(runners):
+        # a config is a duplicate if an earlier runner already runs it
+        # with the same settings; returns [(run, config, earlier run)]
+        seen = {}
+        dups = []
+        for (i, runner) in enumerate(runners):
+            settings = Campaign.run_settings(runner)
+            for config in list(runner.gen_config()):
+                key = (config, settings)
+                if key in seen:
+                    runner.SKIP_CONFIG.add(config)
+                    dups.append((i, config, seen[key]))
+                else:
+                    seen[key] = i
+        return dups
+
+class SetupCost(object):
+    '''
+    Measured wall time spent outside of the benchmark window
+    - mount: umount/mkfs/mount per media:fs
+    - wipe:  wiping a reused file system per media:fs
+    - bench: benchmark time minus warm-up and duration (pre/post work)
+             per bench
+    '''
+    def __init__(self, path):
+        self.path = path
+        self.cost = {}
+        try:
+            with open(self.path) as fd:
+                self.cost = json.load(fd)
+        except (IOError, ValueError):
+            pass
+
+    def get(self, kind, key, default):
+        (n, mean) = self.cost.get(kind, {}).get(key, (0, default))
+        return mean
+
+    def put(self, kind, key, secs):
+        (n, mean) = self.cost.setdefault(kind, {}).get(key, (0, 0.0))
+        self.cost[kind][key] = (n + 1, mean + (secs - mean) / (n + 1))
+
+    def save(self):
+        tmp_path = self.path + ".tmp"
+        with open(tmp_path, "w") as fd:
+            json.dump(self.cost, fd, indent=1, sort_keys=True)
+        os.rename(tmp_path, self.path)
+
+class Planner(object):
+    DEFAULT_MOUNT_SECS = 10.0
+    DEFAULT_WIPE_SECS  = 2.0
+    DEFAULT_BENCH_SECS = 5.0
+
+    def __init__(self, setup_cost):
+        self.setup_cost = setup_cost
+
+    def estimate(self, runner):
+        (nconfig, secs) = (0, 0.0)
+        mount_group = None
+        for (media, fs, bench, ncore, dio) in runner.gen_config():
+            nconfig += 1
+            media_fs = "%s:%s" % (media, fs)
+            bench_secs = runner.get_bench_secs(bench) + \
+                         self.setup_cost.get("bench", bench,
+                                             Planner.DEFAULT_BENCH_SECS)
+            for rep in range(runner.REPETITIONS):
+                if runner.MOUNT_REUSE and mount_group == (media, fs, dio):
+                    secs += self.setup_cost.get("wipe", media_fs,
+                                                Planner.DEFAULT_WIPE_SECS)
+                else:
+                    secs += self.setup_cost.get("mount", media_fs,
+                                                Planner.DEFAULT_MOUNT_SECS)
+                mount_group = (media, fs, dio) if runner.MOUNT_REUSE else None
+                secs += bench_secs
+        return (nconfig, secs)
+
+    def print_plan(self, runners, dups, out=sys.stdout):
+        (total_nconfig, total_secs) = (0, 0.0)
+        print("# run level duration reps configs est.secs", file=out)
+        for (i, runner) in enumerate(runners):
+            (nconfig, secs) = self.estimate(runner)
+            print("%d %s %s %s %d %.0f" %
+                  (i, runner.PERFMON_LEVEL, runner.DURATION,
+                   runner.REPETITIONS, nconfig, secs), file=out)
+            total_nconfig += nconfig
+            total_secs += secs
+        if dups:
+            print("# duplicates removed: run config (same as run)", file=out)
+        for (i, config, j) in dups:
+            print("%d %s (%d)" % (i, ":".join(map(str, config)), j),
+                  file=out)
+        print("### NUM_TEST_CONF  = %d (%d duplicates removed)" %
+              (total_nconfig, len(dups)), file=out)
+        print("### ESTIMATED_TIME = %.0fs (%.1fh)" %
+              (total_secs, total_secs / 3600.0), file=out)
+
+class Journal(object):
+    '''
+    Append-only record of completed configs next to fxmark.log
+    - 1st line: {"machine":{...}, "run":index of Runner in the campaign}
+    - others:   {"config":[media, fs, bench, ncore, dio], "rep":n,
+                 "result":[output lines of the benchmark]}
+    '''
+    NAME = "fxmark.journal"
+
+    def __init__(self, log_dir):
+        self.path = os.path.join(log_dir, Journal.NAME)
+        self.header = None
+        self.done = {} # config -> number of completed repetitions
+
+    def load(self):
+        if not os.path.exists(self.path):
+            return False
+        good_size = 0
+        with open(self.path) as fd:
+            for l in fd:
+                try:
+                    entry = json.loads(l)
+                except ValueError:
+                    break # torn write at the crash
+                good_size += len(l.encode("utf-8"))
+                if self.header is None:
+                    self.header = entry
+                    continue
+                config = tuple(entry["config"])
+                self.done[config] = self.done.get(config, 0) + 1
+        if good_size < os.path.getsize(self.path):
+            os.truncate(self.path, good_size)
+        return self.header is not None
+
+    def start(self, header):
+        if self.header is not None:
+            return
+        self.header = header
+        self._append(header)
+
+    def append(self, config, rep, result):
+        self.done[config] = self.done.get(config, 0) + 1
+        self._append({"config":config, "rep":rep, "result":result})
+
+    def _append(self, entry):
+        with open(self.path, "a") as fd:
+            fd.write(json.dumps(entry) + "\n")
+            fd.flush()
+            os.fsync(fd.fileno())
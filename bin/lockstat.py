@@ -0,0 +1,131 @@
+#!/usr/bin/env python3
+
+import os
+import sys
+import optparse
+from parser import Parser
+
+CUR_DIR = os.path.abspath(os.path.dirname(__file__))
+
+''' lock_stat of PerfMon.LEVEL_PERF_LOCK runs
+
+    - PerfMon adds the top lock classes of a run to its results as
+      lock.{class}.contentions, lock.{class}.waittime.usecs and
+      lock.{class}.holdtime.usecs.
+    - Run as a script, it reports how the wait time of each lock class
+      grows with the number of cores for each media:fs:bench:iomode.
+
+    # NOTE
+    - lockdep and lockstat should be enabled in kernel configuration.
+    - https://www.kernel.org/doc/Documentation/locking/lockstat.txt
+'''
+
+# number of lock classes kept per run for each of
+# contentions, waittime-total and holdtime-total
+TOP_N = 5
+
+# lock_stat columns -> result columns
+FIELDS = [("contentions",    "contentions"),
+          ("waittime-total", "waittime.usecs"),
+          ("holdtime-total", "holdtime.usecs")]
+
+def parse_lock_stat(text):
+    # class name    con-bounces    contentions   waittime-min ...
+    # ----------
+    #   &mm->mmap_sem-W:    46    84    0.26 ...
+    #   ---------------
+    #   &mm->mmap_sem   1   [<ffffffff811502a7>] khugepaged_scan_mm_slot+0x57/0x280
+    (schema, locks) = ([], [])
+    for l in text.splitlines():
+        if "class name" in l:
+            schema = l.split("class name", 1)[1].split()
+            continue
+        p = l.split()
+        if not schema or len(p) <= len(schema):
+            continue
+        (name, vals) = (" ".join(p[:-len(schema)]), p[-len(schema):])
+        if not name.endswith(":"):
+            continue
+        try:
+            d_kv = dict(zip(schema, [float(v) for v in vals]))
+        except ValueError:
+            continue
+        # no whitespace in a result column name
+        d_kv["class"] = "_".join(name[:-1].split())
+        locks.append(d_kv)
+    return locks
+
+def top_locks(locks, n = TOP_N):
+    top = []
+    for (field, col) in FIELDS:
+        for d_kv in sorted(locks, key=lambda d: -d.get(field, 0))[:n]:
+            if d_kv.get(field, 0) > 0 and d_kv not in top:
+                top.append(d_kv)
+    return top
+
+def result_columns(locks, n = TOP_N):
+    # [(name, value)] to be appended to a result line
+    cols = []
+    for d_kv in top_locks(locks, n):
+        for (field, col) in FIELDS:
+            cols.append(("lock.%s.%s" % (d_kv["class"], col),
+                         d_kv.get(field, 0)))
+    return cols
+
+class LockStatReport(object):
+    def __init__(self, log_file):
+        self.parser = Parser()
+        self.parser.parse(log_file)
+
+    def _get_groups(self):
+        # (media, fs, bench, iomode) -> [(ncore, data)]
+        groups = {}
+        for (key, d_kv) in self.parser.search_data():
+            group = (key[0], key[1], key[2]) + tuple(key[4:])
+            groups.setdefault(group, []).append((int(key[3]), d_kv))
+        return groups
+
+    def report(self, out, col = "waittime.usecs"):
+        for (group, runs) in sorted(self._get_groups().items()):
+            runs.sort(key=lambda r: r[0])
+            classes = set()
+            for (ncore, d_kv) in runs:
+                classes.update(k[len("lock."):-len(col) - 1] for k in d_kv
+                               if k.startswith("lock.") and k.endswith(col))
+            if not classes:
+                continue
+
+            # sort by the value at the largest # cores
+            def _val(d_kv, cls):
+                return float(d_kv.get("lock.%s.%s" % (cls, col), 0))
+            (ncore_max, d_max) = runs[-1]
+            (ncore_min, d_min) = runs[0]
+            print("## %s" % ":".join(group), file=out)
+            print("# class %s %s.x%d/x%d" %
+                  (" ".join("%s@%d" % (col, r[0]) for r in runs),
+                   col, ncore_max, ncore_min), file=out)
+            for cls in sorted(classes, key=lambda c: -_val(d_max, c)):
+                growth = _val(d_max, cls) / _val(d_min, cls) \
+                         if _val(d_min, cls) > 0 else float("inf")
+                print("%s %s %g" %
+                      (cls, " ".join("%g" % _val(r[1], cls) for r in runs),
+                       growth), file=out)
+            print("", file=out)
+
+def __print_usage():
+    print("Usage: lockstat.py --log [log file]")
+    print("                   --col [contentions | waittime.usecs | holdtime.usecs]")
+
+
+if __name__ == '__main__':
+    parser = optparse.OptionParser()
+    parser.add_option("--log", help="Log file")
+    parser.add_option("--col", help="{contentions | waittime.usecs | holdtime.usecs}",
+                      default="waittime.usecs")
+    (opts, args) = parser.parse_args()
+
+    if opts.log is None:
+        __print_usage()
+        exit(1)
+
+    LockStatReport(opts.log).report(sys.stdout, opts.col)
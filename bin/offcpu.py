@@ -0,0 +1,124 @@
+#!/usr/bin/env python3
+
+import os
+import re
+import sys
+import subprocess
+import optparse
+
+CUR_DIR = os.path.abspath(os.path.dirname(__file__))
+
+''' Off-CPU time of PerfMon.LEVEL_PERF_OFFCPU runs
+
+    - perf records sched:sched_switch and sched:sched_wakeup with
+      kernel stacks; a benchmark task is
+        . blocked from its switch-out to its wakeup, and
+        . runnable from its wakeup to its next switch-in.
+    - Blocked time is attributed to the stack at switch-out and to the
+      sleepable lock of PerfMon.PROBE_SLEEP_LOCK closest to schedule()
+      in that stack (e.g., mutex_lock, down_write, io_schedule_timeout).
+    - Folded stacks ('comm;root;...;leaf usecs') are for flame graphs.
+'''
+
+# tasks whose off-CPU time is accounted
+COMMS = ["fxmark", "filebench", "go_filebench", "dbench"]
+
+# schedule() itself is in every stack
+NOT_PROBES = ["schedule", "preempt_schedule_common"]
+
+HEADER = re.compile(r"^\s*(.+?)\s+(?:\d+/)?(\d+)\s+\[(\d+)\]\s+"
+                    r"([\d.]+):\s+(?:\d+\s+)?(\S+):\s*(.*)$")
+TRACE_KV = re.compile(r"(\w+)=(\S+)")
+
+def _samples(lines):
+    # (comm, tid, time, event, trace, frames leaf first)
+    sample = None
+    for l in lines:
+        if not l.strip():
+            if sample:
+                yield sample
+            sample = None
+            continue
+        if l[0].isspace() and sample:
+            p = l.split()
+            if len(p) >= 2:
+                sample[5].append(p[1].split("+0x")[0].split(".")[0])
+            continue
+        m = HEADER.match(l)
+        if m:
+            if sample:
+                yield sample
+            sample = (m.group(1), int(m.group(2)), float(m.group(4)),
+                      m.group(5), m.group(6), [])
+    if sample:
+        yield sample
+
+def analyze(lines, probes, comms = COMMS):
+    # returns ({folded stack:usecs}, {total name:usecs})
+    probes = [p for p in probes if p not in NOT_PROBES]
+    totals = dict([("blocked", 0.0), ("runq", 0.0)] +
+                  [(p, 0.0) for p in probes] + [("other", 0.0)])
+    (folded, out, woken) = ({}, {}, {}) # tid -> (time, comm, frames)
+    for (comm, tid, t, event, trace, frames) in _samples(lines):
+        kv = dict(TRACE_KV.findall(trace))
+        if event.endswith("sched_switch"):
+            prev = int(kv.get("prev_pid", tid))
+            if kv.get("prev_comm", comm) in comms and \
+               kv.get("prev_state", "R")[0] not in "R":
+                out[prev] = (t, kv.get("prev_comm", comm), frames)
+            nxt = int(kv.get("next_pid", -1))
+            if nxt not in out:
+                continue
+            (t_out, n_comm, n_frames) = out.pop(nxt)
+            t_wake = woken.pop(nxt, t)
+            blocked = (t_wake - t_out) * 1000000.0
+            totals["blocked"] += blocked
+            totals["runq"] += (t - t_wake) * 1000000.0
+            probe = next((f for f in n_frames if f in probes), "other")
+            totals[probe] += blocked
+            stack = ";".join([n_comm] + n_frames[::-1])
+            folded[stack] = folded.get(stack, 0.0) + blocked
+        elif event.endswith("sched_wakeup") or \
+             event.endswith("sched_waking"):
+            pid = int(kv.get("pid", -1))
+            if pid in out and pid not in woken:
+                woken[pid] = t
+    return (folded, totals)
+
+def result_columns(totals):
+    # [(name, value)] to be appended to a result line
+    return [("offcpu.%s.usecs" % n, v) for (n, v) in totals.items()]
+
+def write_folded(folded, path):
+    with open(path, "w") as fd:
+        for (stack, usecs) in sorted(folded.items()):
+            print("%s %d" % (stack, usecs), file=fd)
+
+def perf_script(perf_data):
+    p = subprocess.Popen("sudo perf script -f -i %s" % perf_data,
+                         shell=True, stdout=subprocess.PIPE,
+                         stderr=subprocess.DEVNULL, universal_newlines=True)
+    return p
+
+def __print_usage():
+    print("Usage: offcpu.py --data [perf data] --folded [folded stack output]")
+
+
+if __name__ == '__main__':
+    from perfmon import PerfMon
+    parser = optparse.OptionParser()
+    parser.add_option("--data",   help="perf data of sched_switch/sched_wakeup")
+    parser.add_option("--folded", help="folded stack output")
+    (opts, args) = parser.parse_args()
+
+    if opts.data is None:
+        __print_usage()
+        exit(1)
+
+    p = perf_script(opts.data)
+    (folded, totals) = analyze(p.stdout, PerfMon.PROBE_SLEEP_LOCK)
+    p.wait()
+    if opts.folded:
+        write_folded(folded, opts.folded)
+    for (n, v) in result_columns(totals):
+        print("%s %g" % (n, v))
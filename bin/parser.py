@@ -1,21 +1,42 @@
 #!/usr/bin/env python3
 import os
 import sys
+import math
 import pdb
 
 CUR_DIR     = os.path.abspath(os.path.dirname(__file__))
 
+# two-sided 95% critical values of Student's t for 1..30 degrees of freedom
+T95 = [12.706, 4.303, 3.182, 2.776, 2.571, 2.447, 2.365, 2.306, 2.262, 2.228,
+        2.201, 2.179, 2.160, 2.145, 2.131, 2.120, 2.110, 2.101, 2.093, 2.086,
+        2.080, 2.074, 2.069, 2.064, 2.060, 2.056, 2.052, 2.048, 2.045, 2.042]
+
 class Parser(object):
+    # fields whose statistics over repetitions are reported
+    # (e.g., works/sec.mean, works/sec.stddev, works/sec.ci95)
+    STAT_FIELDS = ["works/sec"]
+    # counters reported per operation as {field}/op (e.g., perf.cycles/op)
+    PER_OP_FIELDS = ["perf.cycles", "perf.instructions", "perf.LLC-load-misses"]
+
     def __init__(self):
-        self.config = {}   # self.config['SYSTEM'] = 'Linux kernel ...'
-        self.data   = {}   # self.data[ self.key ] = {self.schema:VALUE}
-        self.key    = ()   # (mem, ext2, DWOM, 0002)
-        self.schema = []   # ['ncpu', 'secs', 'works', 'works/sec']
+        self.config  = {}   # self.config['SYSTEM'] = 'Linux kernel ...'
+        self.data    = {}   # self.data[ self.key ] = {self.schema:VALUE}
+        self.samples = {}   # self.samples[ self.key ] = [{self.schema:VALUE}, ...]
+        self.key     = ()   # (mem, ext2, DWOM, 0002)
+        self.schema  = []   # ['ncpu', 'secs', 'works', 'works/sec']
+                            # + ['lat.p50.usecs', ..., 'lat.max.usecs'] with latency
+                            # + ['worker.works/sec.min', ..., 'jain.index', 'w0.works/sec', ...]
+                            # + ['usr.usecs', 'sys.usecs', ..., 'sys.usecs/op', 'csw/op']
+                            # + ['perf.cycles', ..., 'perf.ipc'] with perf stat
 
     def parse(self, log_file):
         for l in self._get_line(log_file):
             parse_fn = self._get_parse_fn(l)
             parse_fn(l)
+        for (key, samples) in self.samples.items():
+            samples = [s for s in samples if s]
+            if samples:
+                self.data[key] = self._aggregate(samples)
 
     def search_data(self, key_list = []):
         results = []
@@ -28,6 +49,43 @@ class Parser(object):
         results.sort()
         return results
 
+    def parse_ts(self, ts_file):
+        # time series of fxmark written with --tslog
+        # - '# usecs works w0 w1 ...' then one line per interval
+        # - works/sec of each interval is added
+        (schema, series, prev_usecs) = ([], [], 0)
+        for l in self._get_line(ts_file):
+            if l.startswith("#"):
+                schema = l.split()[1:]
+                continue
+            d_kv = dict(zip(schema, l.split()))
+            usecs = int(d_kv["usecs"])
+            d_kv["secs"] = str(usecs / 1000000.0)
+            d_kv["works/sec"] = str(float(d_kv["works"]) * 1000000.0 /
+                                    max(usecs - prev_usecs, 1))
+            prev_usecs = usecs
+            series.append(d_kv)
+        return series
+
+    def parse_percpu(self, percpu_file):
+        # per-cpu utilization written by perfmon
+        # - '# cpu user.sec ... iowait.util' then one line per cpu
+        return self._parse_table(percpu_file)
+
+    def parse_syscall(self, syscall_file):
+        # syscall latency percentiles written by perfmon
+        # - '# syscall count p50.usecs ... max.usecs' then one line per syscall
+        return self._parse_table(syscall_file)
+
+    def _parse_table(self, table_file):
+        (schema, rows) = ([], [])
+        for l in self._get_line(table_file):
+            if l.startswith("#"):
+                schema = l.split()[1:]
+                continue
+            rows.append(dict(zip(schema, l.split())))
+        return rows
+
     def get_config(self, key):
         return self.config.get(key, None)
 
@@ -65,17 +123,63 @@ class Parser(object):
     def _parse_key(self, l):
         ks = l.split(" ", 1)[1].split(":")
         self.key = self._norm_key(ks)
+        # each key line starts a new repetition
+        self.samples.setdefault(self.key, []).append({})
 
     def _parse_schema(self, l):
         self.schema = l.split()[1:]
 
     def _parse_data(self, l):
+        samples = self.samples.setdefault(self.key, [{}])
         for (d_key, d_value) in zip(self.schema, l.split()):
-            d_kv = self.data.get(self.key, None)
-            if not d_kv:
-                self.data[self.key] = d_kv = {}
-            d_kv[d_key] = d_value
-        
+            samples[-1][d_key] = d_value
+        self._add_per_op(samples[-1])
+
+    def _add_per_op(self, d_kv):
+        try:
+            works = float(d_kv["works"])
+        except (KeyError, ValueError):
+            return
+        for d_key in Parser.PER_OP_FIELDS:
+            if d_key in d_kv and works > 0:
+                d_kv["%s/op" % d_key] = str(float(d_kv[d_key]) / works)
+
+    def _aggregate(self, samples):
+        # the last sample with numeric fields replaced by their mean
+        # over samples; samples without STAT_FIELDS (e.g., TIMEOUT)
+        # are not counted unless there is nothing else
+        valid = [s for s in samples
+                 if all(f in s for f in Parser.STAT_FIELDS)] or samples
+        d_kv = dict(valid[-1])
+        for d_key in d_kv:
+            try:
+                vals = [float(s[d_key]) for s in valid if d_key in s]
+            except ValueError:
+                continue
+            if len(set(vals)) > 1:
+                d_kv[d_key] = str(sum(vals) / len(vals))
+        d_kv["nsamples"] = str(len(valid))
+        for d_key in Parser.STAT_FIELDS:
+            try:
+                vals = [float(s[d_key]) for s in valid]
+            except (KeyError, ValueError):
+                continue
+            for (stat, val) in self._get_stat(vals).items():
+                d_kv["%s.%s" % (d_key, stat)] = str(val)
+        return d_kv
+
+    def _get_stat(self, vals):
+        n = len(vals)
+        mean = sum(vals) / n
+        (stddev, t) = (0.0, 0.0)
+        dof = n - 1
+        if dof > 0:
+            stddev = math.sqrt(sum((v - mean) ** 2 for v in vals) / dof)
+            t = T95[dof - 1] if dof <= len(T95) else 1.960
+        return {"mean":mean, "stddev":stddev,
+                "min":min(vals), "max":max(vals),
+                "ci95":t * stddev / math.sqrt(n)}
+
     def _norm_str(self, s):
         try:
             n = int(s)
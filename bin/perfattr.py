@@ -0,0 +1,165 @@
+#!/usr/bin/env python3
+
+import os
+import re
+import sys
+import glob
+import fnmatch
+import optparse
+from perfstdio import PerfStdio
+from fs_locking_table import BuildFSLockingTable
+
+CUR_DIR = os.path.abspath(os.path.dirname(__file__))
+
+''' This attributes kernel samples of perf data generated with
+    PerfMon.LEVEL_PERF_RECORD to file system subsystems.
+
+    - Folded stacks are generated (or reused) by perfstdio.
+    - The leaf symbol of a sample decides its subsystem:
+      lock slow paths first, then the source file defining the symbol
+      according to FS_TO_SOURCES of fs_locking_table.py.
+    - One line per config, summed over the repetitions of
+      {media}.{fs}.{bench}.{ncore}.{iomode}.{repetition}.pm.perf.data, as
+      # media fs bench ncore iomode samples %fs %journal %vfs %mm %lock-spin %lock-sleep %other
+'''
+
+class PerfAttr(object):
+    CLASSES = ["fs", "journal", "vfs", "mm",
+               "lock-spin", "lock-sleep", "other"]
+    # slow paths of spinning and sleeping locks
+    LOCK_SYMBOLS = {
+        "lock-spin":["native_queued_spin_lock_slowpath",
+                     "queued_spin_lock_slowpath",
+                     "queued_read_lock_slowpath",
+                     "queued_write_lock_slowpath",
+                     "__pv_queued_spin_lock_slowpath",
+                     "do_raw_spin_lock", "_raw_spin_lock",
+                     "_raw_spin_lock_irq", "_raw_spin_lock_irqsave",
+                     "_raw_spin_lock_bh", "_raw_read_lock",
+                     "_raw_write_lock"],
+        "lock-sleep":["__mutex_lock", "__mutex_lock_slowpath",
+                      "mutex_spin_on_owner", "osq_lock",
+                      "rwsem_down_read_slowpath",
+                      "rwsem_down_write_slowpath",
+                      "rwsem_down_read_failed",
+                      "rwsem_down_write_failed",
+                      "rwsem_spin_on_owner", "rwsem_optimistic_spin",
+                      "__down", "__down_common", "__down_read",
+                      "__down_write", "percpu_down_write",
+                      "__percpu_down_read"],
+    }
+    # journaling code outside of FS_TO_SOURCES["jbd2"]
+    JOURNAL_SOURCES = ["fs/xfs/xfs_log*.c", "fs/btrfs/tree-log.c",
+                       "fs/ext4/ext4_jbd2.c"]
+    MM_SOURCES = ["mm/*.c"]
+    # config fs -> FS_TO_SOURCES key
+    FS_ALIAS = {"ext4_no_jnl":"ext4"}
+    FUNC_DEF = re.compile(r"^(?:[A-Za-z_][\w \t\*]*?[ \t\*])?([A-Za-z_]\w*)\s*\(")
+    NOT_FUNC = set(["if", "for", "while", "switch", "return", "sizeof"])
+
+    def __init__(self, dir_name, ksrc, out_dir_name = None,
+                 jobs = os.cpu_count()):
+        self.perfstdio = PerfStdio(dir_name, out_dir_name, jobs, True)
+        self.ksrc = os.path.abspath(ksrc)
+        self.fs_to_sources = BuildFSLockingTable(self.ksrc).FS_TO_SOURCES
+        self.sym_to_src = {} # {symbol:(fs, file)}
+        self._index_sources()
+
+    def _index_sources(self):
+        # kernel coding style puts the name of a function definition
+        # at the start of a line, which is enough for attribution
+        for (fs, sources) in self.fs_to_sources.items():
+            for src in sources:
+                for path in glob.glob(os.path.join(self.ksrc, src["dir"])):
+                    name = os.path.basename(path)
+                    if any(fnmatch.fnmatch(name, f) for f in src["files"]):
+                        self._index_file(fs, path)
+        for src in PerfAttr.MM_SOURCES:
+            for path in glob.glob(os.path.join(self.ksrc, src)):
+                self._index_file("mm", path)
+
+    def _index_file(self, fs, path):
+        rel = os.path.relpath(path, self.ksrc)
+        with open(path, "r", errors="replace") as fd:
+            for l in fd:
+                if l.rstrip().endswith(";"):
+                    continue
+                m = PerfAttr.FUNC_DEF.match(l)
+                if m and m.group(1) not in PerfAttr.NOT_FUNC:
+                    self.sym_to_src.setdefault(m.group(1), (fs, rel))
+
+    def classify(self, sym, fs):
+        # e.g., ext4_da_write_begin.isra.0 -> ext4_da_write_begin
+        sym = sym.split(".")[0]
+        for (cls, syms) in PerfAttr.LOCK_SYMBOLS.items():
+            if sym in syms:
+                return cls
+        if sym not in self.sym_to_src:
+            return "other"
+        (src_fs, rel) = self.sym_to_src[sym]
+        if any(fnmatch.fnmatch(rel, j) for j in PerfAttr.JOURNAL_SOURCES):
+            return "journal"
+        if src_fs == PerfAttr.FS_ALIAS.get(fs, fs):
+            return "fs"
+        if src_fs == "jbd2":
+            return "journal"
+        if src_fs == "VFS":
+            return "vfs"
+        if src_fs in ("mm", "tmpfs"):
+            return "mm"
+        return "other" # code of the other file systems
+
+    def attribute(self, folded_file, fs):
+        samples = dict((cls, 0) for cls in PerfAttr.CLASSES)
+        with open(folded_file, "r") as fd:
+            for l in fd:
+                (stack, count) = l.rsplit(" ", 1)
+                leaf = stack.rsplit(";", 1)[-1]
+                samples[self.classify(leaf, fs)] += int(count)
+        return samples
+
+    def gen_table(self, out):
+        self.perfstdio.gen_stdio()
+        print("# media fs bench ncore iomode samples %s" %
+              " ".join("%%%s" % cls for cls in PerfAttr.CLASSES), file=out)
+        configs = {} # (media, fs, bench, ncore, iomode) -> samples
+        for folded_file in glob.glob(os.path.join(
+                self.perfstdio.out_dir_name, "*.pm.perf.data" +
+                PerfStdio.FOLDED_SFX)):
+            (media, fs, bench, ncore, iomode) = \
+                os.path.basename(folded_file).split(".")[:5]
+            samples = configs.setdefault(
+                (media, fs, bench, int(ncore), iomode),
+                dict((cls, 0) for cls in PerfAttr.CLASSES))
+            for (cls, n) in self.attribute(folded_file, fs).items():
+                samples[cls] += n
+        for (config, samples) in sorted(configs.items()):
+            nsamples = sum(samples.values())
+            total = max(nsamples, 1)
+            print("%s %d %s %d %s" %
+                  (" ".join(config[:3]), config[3], config[4], nsamples,
+                   " ".join("%.2f" % (samples[cls] * 100.0 / total)
+                            for cls in PerfAttr.CLASSES)), file=out)
+
+def __print_usage():
+    print("Usage: perfattr.py --dir [perf data directory]")
+    print("                   --ksrc [linux source directory]")
+    print("                   --out [perf stdio output directory]")
+    print("                   --jobs [# parallel perf]")
+
+
+if __name__ == '__main__':
+    parser = optparse.OptionParser()
+    parser.add_option("--dir",  help="perf data directory")
+    parser.add_option("--ksrc", help="linux source directory")
+    parser.add_option("--out",  help="perf stdio output directory")
+    parser.add_option("--jobs", help="# parallel perf processes",
+                      type="int", default=os.cpu_count())
+    (opt, args) = parser.parse_args()
+
+    if opt.dir is None or opt.ksrc is None:
+        __print_usage()
+        exit(1)
+
+    perfattr = PerfAttr(opt.dir, opt.ksrc, opt.out, opt.jobs)
+    perfattr.gen_table(sys.stdout)
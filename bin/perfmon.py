@@ -1,12 +1,17 @@
 #!/usr/bin/env python3
 import os
 import sys
+import signal
 import subprocess
 import time
 import operator
 import pdb
 from os.path import join
 from functools import reduce
+from privhelper import PrivHelper, PrivHelperError
+import lockstat
+import offcpu
+import syscallhist
 
 CUR_DIR     = os.path.abspath(os.path.dirname(__file__))
 
@@ -24,10 +29,13 @@ class PerfMon(object):
     LEVEL_PERF_RECORD             = 1
     LEVEL_PERF_PROBE_SLEEP_LOCK_D = 2
     LEVEL_PERF_STAT               = 3
+    LEVEL_PERF_OFFCPU             = 4
+    LEVEL_SYSCALL_HIST            = 5
     LEVEL_PERF_PROBE_SLEEP_LOCK   = 998 # Well, it it not useful for fxmark.
     LEVEL_PERF_LOCK               = 999 # Well, it is mostly useless.
     CPU_STAT   = ["real", "user", "nice", "sys", "idle",
                   "iowait", "irq", "softirq", "steal", "guest"]
+    PERCPU_STAT = ["user", "sys", "idle", "iowait"]
     SC_CLK_TCK = float(os.sysconf("SC_CLK_TCK"))
     PROBE_SLEEP_LOCK = [
         # - mutex
@@ -47,22 +55,55 @@ class PerfMon(object):
         #   "schedule_timeout",
     ]
     PERF_SAMPLE_RATE              = 1000
+    PERF_START_TIMEOUT = 10  # seconds for perf to get ready
+    PERF_STOP_TIMEOUT  = 120 # seconds for perf to flush and exit
+    PERF_STAT_EVENTS = ["cycles", "instructions", "LLC-load-misses",
+                        "context-switches", "cpu-migrations", "page-faults"]
+    # telemetry time series: cumulative counters of
+    # /proc/diskstats (device under test), /proc/vmstat and /proc/meminfo
+    TELEMETRY = ["usecs",
+                 "rd_ios", "rd_sectors", "wr_ios", "wr_sectors",
+                 "in_flight", "io_ticks", "time_in_queue",
+                 "nr_dirty", "nr_writeback", "pgscan",
+                 "Dirty", "Writeback", "MemFree", "Cached"]
+    SECTOR_SIZE = 512
+    TRACEFS = "/sys/kernel/tracing"
+    TRACEFS_ERRORS = (OSError, subprocess.CalledProcessError, PrivHelperError)
 
     # init
     def __init__(self, \
                  level = int(os.environ.get('PERFMON_LEVEL', "0")), \
                  ldir  =     os.environ.get('PERFMON_LDIR',  "."), \
                  lfile =     os.environ.get('PERFMON_LFILE', "_perfmon.stat" ),\
+                 cpus  =     os.environ.get('PERFMON_CPUS',  ""),\
+                 dev   =     os.environ.get('PERFMON_DEV',   ""),\
+                 tm_msecs = int(os.environ.get('PERFMON_TELEMETRY_MSECS', "1000")),\
                  duration = 30):
         (self.LEVEL, self.DIR, self.FILE) = (level, ldir, lfile)
+        # block device under test and telemetry interval (0: disable)
+        self.DEV = os.path.basename(os.path.realpath(dev)) if dev else ""
+        self.TELEMETRY_MSECS = tm_msecs
+        # cpus to account when the other cpus are not offline
+        # (e.g., cpuset). An empty set means the aggregated "cpu " line.
+        self.CPUS = set(int(c) for c in cpus.split(",") if c)
         self.duration = duration
         self.cpu_stat = os.path.normpath(
             os.path.join(self.DIR, self.FILE))
+        self.percpu_stat = self.cpu_stat + ".percpu"
+        self.telemetry = self.cpu_stat + ".telemetry"
+        self.telemetry_pid = self.telemetry + ".pid"
+        self.perf_pid = self.cpu_stat + ".perf.pid"
+        self.perf_log = self.cpu_stat + ".perf.log"
+        self.pm_extra = [] # [(name, value)] appended to the cpu stat
+        self.priv = PrivHelper() \
+                    if os.environ.get(PrivHelper.SOCK_ENV, None) else None
 
     # entry
     def start(self):
         if self.LEVEL >= PerfMon.LEVEL_LOW:
             self._cpu_stat_start()
+        if self.LEVEL >= PerfMon.LEVEL_LOW and self.TELEMETRY_MSECS > 0:
+            self._telemetry_start()
         if self.LEVEL == PerfMon.LEVEL_PERF_RECORD:
             self._perf_record_start()
         if self.LEVEL == PerfMon.LEVEL_PERF_PROBE_SLEEP_LOCK:
@@ -73,6 +114,10 @@ class PerfMon(object):
             self._perf_probe_sleep_lock_start("%ax")
         if self.LEVEL == PerfMon.LEVEL_PERF_LOCK:
             self._perf_lock_record_start()
+        if self.LEVEL == PerfMon.LEVEL_PERF_OFFCPU:
+            self._perf_offcpu_start()
+        if self.LEVEL == PerfMon.LEVEL_SYSCALL_HIST:
+            self._syscall_hist_start()
 
     def stop(self):
         try:
@@ -84,8 +129,14 @@ class PerfMon(object):
                 self._perf_probe_sleep_lock_stop()
             if self.LEVEL == PerfMon.LEVEL_PERF_STAT:
                 self._perf_stat_stop()
+            if self.LEVEL == PerfMon.LEVEL_PERF_OFFCPU:
+                self._perf_offcpu_stop()
+            if self.LEVEL == PerfMon.LEVEL_SYSCALL_HIST:
+                self._syscall_hist_stop()
             if self.LEVEL == PerfMon.LEVEL_PERF_PROBE_SLEEP_LOCK_D:
                 self._perf_probe_sleep_lock_stop()
+            if self.LEVEL >= PerfMon.LEVEL_LOW and self.TELEMETRY_MSECS > 0:
+                self._telemetry_stop()
             if self.LEVEL >= PerfMon.LEVEL_LOW:
                 self._cpu_stat_stop()
         finally:
@@ -93,14 +144,19 @@ class PerfMon(object):
 
     # cpu utilization
     def _cpu_stat_start(self):
-        (ncpu, cpu_stat) = self._get_cpu_stat()
+        (ncpu, cpu_stat, percpu_stat) = self._get_cpu_stat()
         cpu_stat_str = " ".join( map(lambda x: str(x), cpu_stat))
         with open(self.cpu_stat, "w") as fd:
             print(cpu_stat_str, file=fd)
             fd.flush()
+        with open(self.percpu_stat, "w") as fd:
+            for (cpu, vals) in sorted(percpu_stat.items()):
+                print(cpu, " ".join(map(lambda x: str(x), vals)), file=fd)
+            fd.flush()
 
     def _cpu_stat_stop(self):
-        (ncpu, stat_stop) = self._get_cpu_stat()
+        (ncpu, stat_stop, percpu_stop) = self._get_cpu_stat()
+        self._percpu_stat_stop(percpu_stop)
         with open(self.cpu_stat, "r") as fd:
             stat_start = [float(p) for p in fd.readline().strip().split()]
         delta = list(map(operator.sub, stat_stop, stat_start))
@@ -115,10 +171,41 @@ class PerfMon(object):
         name = list( map(lambda x: "%s.sec" % x, PerfMon.CPU_STAT))
         name.extend( list( map(lambda x: "%s.util" % x, PerfMon.CPU_STAT[1:])))
 
+        # e.g., telemetry summary; counters such as perf.cycles keep
+        # all of their digits for the */op values of Parser
+        name.extend([n for (n, v) in self.pm_extra])
+        vals = list( map(lambda x: "%g" % x, delta))
+        vals.extend([repr(v) for (n, v) in self.pm_extra])
+
         # write to file
         with open(self.cpu_stat, "w") as fd:
             print( " ".join(name), file=fd)
-            print( " ".join( map(lambda x: "%g" % x, delta)), file=fd)
+            print( " ".join(vals), file=fd)
+            fd.flush()
+
+    def _percpu_stat_stop(self, percpu_stop):
+        # {cpu: [user, nice, sys, idle, iowait, ...]} in ticks
+        percpu_start = {}
+        with open(self.percpu_stat, "r") as fd:
+            for l in fd:
+                p = l.split()
+                percpu_start[int(p[0])] = [int(v) for v in p[1:]]
+
+        # cpu user.sec sys.sec ... user.util sys.util ...
+        with open(self.percpu_stat, "w") as fd:
+            name = ["%s.sec" % s for s in PerfMon.PERCPU_STAT] + \
+                   ["%s.util" % s for s in PerfMon.PERCPU_STAT]
+            print("# cpu %s" % " ".join(name), file=fd)
+            for (cpu, vals) in sorted(percpu_stop.items()):
+                if cpu not in percpu_start:  # onlined in between
+                    continue
+                delta = list(map(operator.sub, vals, percpu_start[cpu]))
+                total = float(max(sum(delta), 1))
+                # user includes nice as top(1) does
+                secs = [delta[0] + delta[1], delta[2], delta[3], delta[4]]
+                print(cpu, " ".join(
+                    ["%g" % (s/PerfMon.SC_CLK_TCK) for s in secs] +
+                    ["%g" % (s/total * 100.0) for s in secs]), file=fd)
             fd.flush()
 
     def _get_cpu_stat(self):
@@ -134,28 +221,213 @@ class PerfMon(object):
         # - steal: involuntary wait
         # - guest: running a normal guest
         # - guest_nice: running a niced guest
-        p = self._exec_cmd("sudo cat /proc/stat", subprocess.PIPE)
+        #
+        # /proc/stat is world-readable so it is read in-process.
+        # Per-cpu lines are kept for online cpus in self.CPUS,
+        # or all online cpus if self.CPUS is empty.
         ncpus = 0
         cpu_stat = []
-        for l in p.stdout.readlines():
-            l = l.decode("utf-8").strip()
+        cpu_sum = None
+        percpu_stat = {}
+        with open("/proc/stat", "r") as fd:
+            lines = fd.readlines()
+        for l in lines:
+            l = l.strip()
             if l.startswith("cpu"):
                 ncpus += 1
                 if l.startswith("cpu "):
                     cpu_stat = [time.time()] + \
                                [int(p)/PerfMon.SC_CLK_TCK \
                                 for p in l[4:].strip().split()]
-        return (ncpus - 1, cpu_stat[:len(PerfMon.CPU_STAT)])
+                    continue
+                cpu = int(l.split()[0][3:])
+                if self.CPUS and cpu not in self.CPUS:
+                    continue
+                vals = [int(p) for p in l.split()[1:]]
+                percpu_stat[cpu] = vals
+                if self.CPUS:
+                    cpu_sum = vals if cpu_sum is None else \
+                              list(map(operator.add, cpu_sum, vals))
+        if cpu_sum is not None:
+            cpu_stat = [cpu_stat[0]] + \
+                       [p/PerfMon.SC_CLK_TCK for p in cpu_sum]
+        return (ncpus - 1, cpu_stat[:len(PerfMon.CPU_STAT)], percpu_stat)
+
+    # system telemetry
+    def _telemetry_start(self):
+        # sample in a daemon which outlives this process
+        # until _telemetry_stop() terminates it
+        pid = os.fork()
+        if pid:
+            with open(self.telemetry_pid, "w") as fd:
+                print(pid, file=fd)
+            return
+        try:
+            os.setsid()
+            # do not hold stdout of fxmark which its runner reads to EOF
+            null = os.open(os.devnull, os.O_RDWR)
+            for fd in (0, 1, 2):
+                os.dup2(null, fd)
+            self._telemetry_loop()
+        finally:
+            os._exit(0)
+
+    def _telemetry_loop(self):
+        class _Stop(Exception):
+            pass
+        def _stop(signum, frame):
+            raise _Stop()
+        signal.signal(signal.SIGTERM, _stop)
+
+        start = time.time()
+        try:
+            with open(self.telemetry, "w") as fd:
+                print("# %s" % " ".join(PerfMon.TELEMETRY), file=fd)
+                try:
+                    while True:
+                        # a sample line is never torn by SIGTERM
+                        signal.pthread_sigmask(signal.SIG_BLOCK,
+                                               [signal.SIGTERM])
+                        self._telemetry_sample(fd, start)
+                        signal.pthread_sigmask(signal.SIG_UNBLOCK,
+                                               [signal.SIGTERM])
+                        time.sleep(self.TELEMETRY_MSECS / 1000.0)
+                except _Stop:
+                    signal.pthread_sigmask(signal.SIG_BLOCK,
+                                           [signal.SIGTERM])
+                    self._telemetry_sample(fd, start)
+        finally:
+            try:
+                os.unlink(self.telemetry_pid)
+            except OSError:
+                pass
+
+    def _telemetry_sample(self, fd, start):
+        d_kv = {"usecs":int((time.time() - start) * 1000000)}
+        d_kv.update(self._get_diskstats())
+        d_kv.update(self._get_vmstat())
+        d_kv.update(self._get_meminfo())
+        print(" ".join(str(d_kv.get(n, 0)) for n in PerfMon.TELEMETRY),
+              file=fd)
+        fd.flush()
+
+    def _get_diskstats(self):
+        # major minor name rd_ios rd_merges rd_sectors rd_ticks
+        #   wr_ios wr_merges wr_sectors wr_ticks
+        #   in_flight io_ticks time_in_queue ...
+        names = [None, None, None, "rd_ios", None, "rd_sectors", None,
+                 "wr_ios", None, "wr_sectors", None,
+                 "in_flight", "io_ticks", "time_in_queue"]
+        if not self.DEV:
+            return {}
+        with open("/proc/diskstats", "r") as fd:
+            for l in fd:
+                p = l.split()
+                if p[2] == self.DEV:
+                    return {n:int(v) for (n, v) in zip(names, p) if n}
+        return {}
+
+    def _get_vmstat(self):
+        d_kv = {"pgscan":0}
+        with open("/proc/vmstat", "r") as fd:
+            for l in fd:
+                (n, v) = l.split()
+                if n in ("nr_dirty", "nr_writeback"):
+                    d_kv[n] = int(v)
+                elif n.startswith("pgscan_"): # pgscan_{kswapd,direct,...}
+                    d_kv["pgscan"] += int(v)
+        return d_kv
+
+    def _get_meminfo(self):
+        d_kv = {}
+        with open("/proc/meminfo", "r") as fd:
+            for l in fd:
+                p = l.split()
+                n = p[0].rstrip(":")
+                if n in ("Dirty", "Writeback", "MemFree", "Cached"):
+                    d_kv[n] = int(p[1]) # kB
+        return d_kv
+
+    def _telemetry_stop(self):
+        try:
+            with open(self.telemetry_pid, "r") as fd:
+                pid = int(fd.readline())
+            os.kill(pid, signal.SIGTERM)
+        except (IOError, OSError, ValueError):
+            return
+        # the daemon removes its pid file when the last sample is written
+        for i in range(100):
+            if not os.path.exists(self.telemetry_pid):
+                break
+            time.sleep(0.02)
+        self.pm_extra.extend(self._telemetry_summary())
+
+    def _telemetry_summary(self):
+        samples = []
+        with open(self.telemetry, "r") as fd:
+            for l in fd:
+                p = l.split()
+                if l.startswith("#") or len(p) != len(PerfMon.TELEMETRY):
+                    continue
+                samples.append(dict(zip(PerfMon.TELEMETRY,
+                                        [int(v) for v in p])))
+        if len(samples) < 2:
+            return []
+        (first, last) = (samples[0], samples[-1])
+        delta = {n:last[n] - first[n] for n in PerfMon.TELEMETRY}
+        secs = max(delta["usecs"], 1) / 1000000.0
+        return [
+            ("disk.iops", (delta["rd_ios"] + delta["wr_ios"]) / secs),
+            ("disk.mb/s", (delta["rd_sectors"] + delta["wr_sectors"]) *
+                          PerfMon.SECTOR_SIZE / secs / 1000000.0),
+            # time_in_queue is weighted by the number of in-flight ios
+            ("disk.qdepth", delta["time_in_queue"] / (secs * 1000.0)),
+            ("dirty.peak.kb", max(s["Dirty"] for s in samples)),
+            ("writeback.peak.kb", max(s["Writeback"] for s in samples)),
+            ("pgscan", delta["pgscan"]),
+        ]
 
     # perf stat
+    def _perf_stat_out(self):
+        return os.path.normpath(
+                os.path.join(self.DIR, "%s.perf.stat.data" % self.FILE))
+
     def _perf_stat_stop(self):
-        pass
+        # perf stat writes counts when it exits on SIGINT
+        self._perf_stop()
+        counts = self._parse_perf_stat(self._perf_stat_out())
+        if not counts:
+            return
+        for ev in PerfMon.PERF_STAT_EVENTS:
+            self.pm_extra.append(("perf.%s" % ev, int(counts.get(ev, 0))))
+        self.pm_extra.append(("perf.ipc",
+                              counts.get("instructions", 0) /
+                              float(max(counts.get("cycles", 0), 1))))
+
+    def _parse_perf_stat(self, perf_out):
+        # perf stat -x, : value,unit,event,run-time,pcnt,...
+        # where value can be <not counted> or <not supported>
+        counts = {}
+        try:
+            with open(perf_out, "r") as fd:
+                for l in fd:
+                    p = l.strip().split(",")
+                    if l.startswith("#") or len(p) < 3:
+                        continue
+                    ev = p[2].split(":")[0] # e.g., cycles:u
+                    try:
+                        counts[ev] = float(p[0])
+                    except ValueError:
+                        counts[ev] = 0
+        except IOError:
+            pass
+        return counts
 
     def _perf_stat_start(self):
-        perf_out = os.path.normpath(
-                os.path.join(self.DIR, "%s.perf.stat.data" % self.FILE))
-        self._exec_cmd("sudo perf stat -a -g -o %s sleep %s &" %
-                (perf_out, self.duration))
+        perf_out = self._perf_stat_out()
+        self._perf_start(["stat", "-a", "-x,",
+                          "-e", ",".join(PerfMon.PERF_STAT_EVENTS),
+                          "-o", perf_out], perf_out)
 
     # perf record
     def _perf_record_stop(self):
@@ -164,8 +436,8 @@ class PerfMon(object):
     def _perf_record_start(self):
         perf_out = os.path.normpath(
             os.path.join(self.DIR, "%s.perf.data" % self.FILE))
-        self._exec_cmd("sudo perf record -F %s -a -g -o %s &" %
-                       (PerfMon.PERF_SAMPLE_RATE, perf_out))
+        self._perf_start(["record", "-F", str(PerfMon.PERF_SAMPLE_RATE),
+                          "-a", "-g", "-o", perf_out], perf_out)
 
     # perf probe sleepable locks
     def _perf_probe_cleanup(self):
@@ -177,9 +449,9 @@ class PerfMon(object):
             self._exec_cmd("sudo perf probe --add \'%s %s\'" % (prob, arg0))
 
     def _perf_probe_cmdline(self, arg0):
-        probe_opt = ""
+        probe_opt = []
         for prob in PerfMon.PROBE_SLEEP_LOCK:
-            probe_opt += " -e probe:%s" % prob
+            probe_opt += ["-e", "probe:%s" % prob]
         if len(arg0) > 0:
             perf_out = os.path.normpath(
                 os.path.join(self.DIR, "%s.perf.sleeplock.%s.data" %
@@ -188,8 +460,9 @@ class PerfMon(object):
             perf_out = os.path.normpath(
                 os.path.join(self.DIR, "%s.perf.sleeplock.data" %
                              self.FILE))
-        return ("sudo perf record %s -F %s -a -g -o %s &" %
-                (probe_opt, PerfMon.PERF_SAMPLE_RATE, perf_out))
+        return (["record"] + probe_opt +
+                ["-F", str(PerfMon.PERF_SAMPLE_RATE), "-a", "-g",
+                 "-o", perf_out], perf_out)
 
     def _perf_probe_sleep_lock_stop(self):
         self._perf_stop()
@@ -197,26 +470,197 @@ class PerfMon(object):
 
     def _perf_probe_sleep_lock_start(self, arg0):
         self._perf_probe_add_trace_points(arg0)
-        cmdline = self._perf_probe_cmdline(arg0)
-        self._exec_cmd(cmdline)
+        (args, perf_out) = self._perf_probe_cmdline(arg0)
+        self._perf_start(args, perf_out)
+
+    # off-cpu time
+    def _perf_offcpu_out(self):
+        return os.path.normpath(
+            os.path.join(self.DIR, "%s.perf.offcpu.data" % self.FILE))
+
+    def _perf_offcpu_start(self):
+        perf_out = self._perf_offcpu_out()
+        self._perf_start(["record", "-e", "sched:sched_switch",
+                          "-e", "sched:sched_wakeup",
+                          "-a", "-g", "-o", perf_out], perf_out)
+
+    def _perf_offcpu_stop(self):
+        self._perf_stop()
+        perf_out = self._perf_offcpu_out()
+        p = offcpu.perf_script(perf_out)
+        (folded, totals) = offcpu.analyze(p.stdout, PerfMon.PROBE_SLEEP_LOCK)
+        p.wait()
+        offcpu.write_folded(folded, "%s.folded.txt" % perf_out)
+        self.pm_extra.extend(offcpu.result_columns(totals))
+
+    # syscall latency histograms
+    def _syscall_hist_start(self):
+        self._syscall_hist_cleanup()
+        self._write_tracefs("synthetic_events", syscallhist.SYNTH_EVENT)
+        for (i, (path, trigger)) in enumerate(syscallhist.TRIGGERS):
+            if i == 0:
+                # only benchmark tasks if the kernel can filter by comm
+                try:
+                    self._write_tracefs(path, trigger + self._syscall_filter())
+                    continue
+                except PerfMon.TRACEFS_ERRORS:
+                    pass
+            self._write_tracefs(path, trigger)
+
+    def _syscall_filter(self):
+        return syscallhist.comm_filter(offcpu.COMMS)
+
+    def _syscall_hist_stop(self):
+        text = self._read_tracefs(syscallhist.HIST)
+        self._syscall_hist_cleanup()
+        (hist, dropped) = syscallhist.parse_hist(text)
+        syscallhist.write_table(hist, "%s.syscall" % self.cpu_stat)
+        self.pm_extra.extend(syscallhist.result_columns(hist, dropped))
+
+    def _syscall_hist_cleanup(self):
+        # detach in the reverse order; a trigger is removed only by
+        # the same command, so try it with and without the filter
+        for (path, trigger) in reversed(syscallhist.TRIGGERS):
+            for flt in (self._syscall_filter(), ""):
+                try:
+                    self._write_tracefs(path, "!" + trigger + flt)
+                except PerfMon.TRACEFS_ERRORS:
+                    pass
+        try:
+            self._write_tracefs("synthetic_events",
+                                "!" + syscallhist.SYNTH_EVENT)
+        except PerfMon.TRACEFS_ERRORS:
+            pass
 
     # perf lock record
     def _perf_lock_record_stop(self):
-        self._exec_cmd("sudo sh -c \"echo 0 >/proc/sys/kernel/lock_stat\"")
+        self._write_sysctl("kernel.lock_stat", 0)
         self._perf_stop()
         lock_stat = os.path.normpath(
             os.path.join(self.DIR, "%s.perf.lock_stat" % self.FILE))
-        self._exec_cmd("sudo cp /proc/lock_stat %s" % lock_stat)
+        text = self._read_procfs("/proc/lock_stat")
+        with open(lock_stat, "w") as fd:
+            fd.write(text)
+        self.pm_extra.extend(lockstat.result_columns(
+            lockstat.parse_lock_stat(text)))
 
     def _perf_lock_record_start(self):
-        self._exec_cmd("sudo sh -c \"echo 1 >/proc/sys/kernel/lock_stat\"")
+        # statistics of this run only
+        self._write_procfs("/proc/lock_stat", 0)
+        self._write_sysctl("kernel.lock_stat", 1)
         perf_out = os.path.normpath(
             os.path.join(self.DIR, "%s.perf.lock.data" % self.FILE))
-        self._exec_cmd("sudo perf lock record -a -g -o %s &" % perf_out)
+        self._perf_start(["lock", "record", "-a", "-g", "-o", perf_out],
+                         perf_out)
+
+    # perf process of this session
+    # - it is tracked by a pid file per PERFMON_LFILE so that
+    #   sessions of different PERFMON_LFILE can run at the same time
+    # - the pid file has the pid of perf itself, not of sudo, so that
+    #   stopping perf does not depend on sudo relaying signals
+    def _perf_start(self, args, perf_out):
+        if os.path.exists(perf_out):
+            os.unlink(perf_out)
+        with open(self.perf_log, "w") as log:
+            p = subprocess.Popen(["sudo", "perf"] + args,
+                                 stdout=log, stderr=log,
+                                 start_new_session=True)
+
+        # perf is ready once it runs and has written the header of
+        # its output, which it does after opening its events
+        (pid, ready) = (None, False)
+        deadline = time.time() + PerfMon.PERF_START_TIMEOUT
+        while time.time() < deadline and p.poll() is None:
+            pid = pid or self._find_descendant(p.pid, "perf")
+            if pid and self._is_running(pid) and \
+               os.path.exists(perf_out) and os.path.getsize(perf_out) > 0:
+                ready = True
+                break
+            time.sleep(0.01)
+        with open(self.perf_pid, "w") as fd:
+            print(pid or p.pid, file=fd)
+        if not ready:
+            print("WARNING: perf is not ready; see %s" % self.perf_log,
+                  file=sys.stderr)
+
+    def _find_descendant(self, ancestor, comm):
+        # perf is a child of sudo, or a grandchild when sudo runs it
+        # on a pseudo-terminal; /proc/[pid]/stat of root is readable
+        procs = {} # pid -> (comm, ppid)
+        for pid in filter(str.isdigit, os.listdir("/proc")):
+            try:
+                with open("/proc/%s/stat" % pid, "r") as fd:
+                    stat = fd.read()
+            except IOError:
+                continue
+            # comm may contain spaces or parentheses
+            (beg, end) = (stat.find("("), stat.rfind(")"))
+            procs[int(pid)] = (stat[beg + 1:end],
+                               int(stat[end + 2:].split()[1]))
+        for (pid, (name, ppid)) in procs.items():
+            if name != comm:
+                continue
+            while ppid in procs and ppid != ancestor:
+                ppid = procs[ppid][1]
+            if ppid == ancestor:
+                return pid
+        return None
 
     def _perf_stop(self):
+        try:
+            with open(self.perf_pid, "r") as fd:
+                pid = int(fd.readline())
+        except (IOError, ValueError):
+            return
         with open("/dev/null", "a") as fd:
-            self._exec_cmd("sudo kill -INT $(pgrep perf)", fd)
+            self._exec_cmd("sudo kill -INT %d" % pid, fd)
+
+        # wait for perf to flush its output and exit
+        deadline = time.time() + PerfMon.PERF_STOP_TIMEOUT
+        while time.time() < deadline and self._is_running(pid):
+            time.sleep(0.05)
+        os.unlink(self.perf_pid)
+
+    def _is_running(self, pid):
+        # a zombie is done as well; it is not our child to reap
+        try:
+            with open("/proc/%d/stat" % pid, "r") as fd:
+                return fd.read().rsplit(")", 1)[1].split()[0] != "Z"
+        except (IOError, IndexError):
+            return False
+
+    # privileged operations
+    def _read_procfs(self, path):
+        if self.priv:
+            return self.priv.read_procfs(path)
+        p = self._exec_cmd("sudo cat %s" % path, subprocess.PIPE)
+        return p.stdout.read().decode("utf-8")
+
+    def _write_tracefs(self, path, value):
+        path = os.path.join(PerfMon.TRACEFS, path)
+        if self.priv:
+            return self.priv.write_tracefs(path, value)
+        subprocess.run(["sudo", "tee", "-a", path], input=value.encode(),
+                       stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+                       check=True)
+
+    def _read_tracefs(self, path):
+        path = os.path.join(PerfMon.TRACEFS, path)
+        if self.priv:
+            return self.priv.read_tracefs(path)
+        p = self._exec_cmd("sudo cat %s" % path, subprocess.PIPE)
+        return p.stdout.read().decode("utf-8")
+
+    def _write_procfs(self, path, value):
+        if self.priv:
+            return self.priv.write_procfs(path, value)
+        subprocess.run(["sudo", "tee", path], input=str(value).encode(),
+                       stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+
+    def _write_sysctl(self, name, value):
+        if self.priv:
+            return self.priv.write_sysctl(name, value)
+        self._write_procfs("/proc/sys/%s" % name.replace(".", "/"), value)
 
     def _exec_cmd(self, cmd, out=None):
         p = subprocess.Popen(cmd, shell=True, stdout=out, stderr=out)
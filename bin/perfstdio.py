@@ -3,59 +3,141 @@
 import os
 import subprocess
 import optparse
+from multiprocessing import Pool
 
 CUR_DIR = os.path.abspath(os.path.dirname(__file__))
 
 ''' This is used for generating stdio output of multiple files in
     a directory or a single file. Only specify the directory and
     it will generate the file there itself.
+
+    - Files are processed in parallel by up to --jobs worker processes,
+      each running perf and folding its output.
+    - An output newer than its perf data is reused as is.
+    - With --folded, folded stacks for flame graphs
+      (i.e., 'comm;root;...;leaf count' per line) are also generated.
 '''
 
 class PerfStdio(object):
-    def __init__(self, dir_name, out_dir_name = None):
+    STDIO_SFX  = ".stdio.txt"
+    FOLDED_SFX = ".folded.txt"
+
+    def __init__(self, dir_name, out_dir_name = None,
+                 jobs = os.cpu_count(), folded = False):
         self.dir_name = os.path.join(CUR_DIR, dir_name)
         if out_dir_name is None:
             self.out_dir_name = self.dir_name
         else:
-            self.out_dir_name = self.out_dir_name
+            self.out_dir_name = out_dir_name
         self.out_dir_name = os.path.join(CUR_DIR, self.out_dir_name)
+        self.jobs = max(jobs or 1, 1)
+        self.folded = folded
 
     def gen_stdio(self):
         if (not os.path.isdir(self.out_dir_name)):
             os.mkdir(self.out_dir_name)
-        for f in os.listdir(self.dir_name):
-            if f.endswith(("data")):
-                print("parsing %s ..." % f)
-                stdio_filename = f + ".stdio.txt"
-                cmd_arg = "sudo perf report -f --stdio -i %s" % ( \
-                        os.path.join(self.dir_name, f))
-                out_fd = open(os.path.join(self.out_dir_name, stdio_filename), "w")
-                self._exec_cmd(cmd_arg, out_fd)
-                out_fd.close()
-                print("parsing %s ... done" % f)
+        files = sorted(f for f in os.listdir(self.dir_name)
+                       if f.endswith(("data")))
+        pool = Pool(self.jobs)
+        try:
+            for msg in pool.imap_unordered(self._gen_stdio_file, files):
+                print(msg)
+        finally:
+            pool.close()
+            pool.join()
+
+    def _gen_stdio_file(self, f):
+        # runs in a worker process since folding is pure Python
+        data = os.path.join(self.dir_name, f)
+        stdio = os.path.join(self.out_dir_name, f + PerfStdio.STDIO_SFX)
+        folded = os.path.join(self.out_dir_name, f + PerfStdio.FOLDED_SFX)
+        done = []
+        if not self._is_fresh(stdio, data):
+            cmd_arg = "sudo perf report -f --stdio -i %s" % data
+            self._exec_cmd_to(cmd_arg, stdio)
+            done.append("stdio")
+        if self.folded and not self._is_fresh(folded, data):
+            cmd_arg = "sudo perf script -f -i %s" % data
+            p = subprocess.Popen(cmd_arg, shell=True,
+                                 stdout=subprocess.PIPE,
+                                 stderr=subprocess.DEVNULL,
+                                 universal_newlines=True)
+            stacks = fold_perf_script(p.stdout)
+            p.wait()
+            with open(folded + ".tmp", "w") as out_fd:
+                for (stack, count) in sorted(stacks.items()):
+                    print("%s %d" % (stack, count), file=out_fd)
+            os.rename(folded + ".tmp", folded)
+            done.append("folded")
+        if not done:
+            return "parsing %s ... up to date" % f
+        return "parsing %s ... done (%s)" % (f, ", ".join(done))
+
+    def _is_fresh(self, out, data):
+        try:
+            return os.path.getmtime(out) >= os.path.getmtime(data)
+        except OSError:
+            return False
+
+    def _exec_cmd_to(self, cmd, out_file):
+        # write to a temporary file first so that an interrupted
+        # run never leaves a fresh-looking partial output
+        with open(out_file + ".tmp", "w") as out_fd:
+            self._exec_cmd(cmd, out_fd)
+        os.rename(out_file + ".tmp", out_file)
 
     def _exec_cmd(self, cmd, out=subprocess.STDOUT):
         p = subprocess.Popen(cmd, shell=True,
                 stdout=out, stderr=subprocess.PIPE)
-        p.wait()
+        p.communicate()
         if out is not subprocess.STDOUT:
             out.flush()
         return p
 
+def fold_perf_script(lines):
+    # perf script prints a sample as a header line followed by
+    # its call chain, leaf first, and a blank line:
+    #   comm  pid [cpu] time: period event:
+    #   	ffffffff81234567 func+0x12 ([kernel.kallsyms])
+    stacks = {}
+    (comm, frames) = (None, [])
+    for l in lines:
+        if not l.strip():
+            if comm is not None:
+                stack = ";".join([comm] + frames[::-1])
+                stacks[stack] = stacks.get(stack, 0) + 1
+            (comm, frames) = (None, [])
+        elif l[0].isspace():
+            p = l.split()
+            if len(p) >= 2:
+                frames.append(p[1].split("+0x")[0])
+        else:
+            comm = l.split()[0]
+    if comm is not None:
+        stack = ";".join([comm] + frames[::-1])
+        stacks[stack] = stacks.get(stack, 0) + 1
+    return stacks
+
 def __print_usage():
     print("Usage: perfstdio.py --dir [directory]")
     print("                    --out [output directory]")
+    print("                    --jobs [# parallel perf]")
+    print("                    --folded")
 
 
 if __name__ == '__main__':
     parser = optparse.OptionParser()
     parser.add_option("--dir",  help="perf data directory")
     parser.add_option("--out",  help="perf stdio output directory")
+    parser.add_option("--jobs", help="# parallel perf processes",
+                      type="int", default=os.cpu_count())
+    parser.add_option("--folded", help="also generate folded stacks",
+                      action="store_true", default=False)
     (opt, args) = parser.parse_args()
 
     if opt.dir is None:
         __print_usage()
         exit(1)
 
-    perfstdio = PerfStdio(opt.dir, opt.out)
+    perfstdio = PerfStdio(opt.dir, opt.out, opt.jobs, opt.folded)
     perfstdio.gen_stdio()
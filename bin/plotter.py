@@ -1,5 +1,6 @@
 #!/usr/bin/env python3
 import os
+import glob
 import stat
 import sys
 import subprocess
@@ -29,6 +30,7 @@ class Plotter(object):
                           "idle.util",
                           "iowait.util"]
         self.UNIT = 1000000.0
+        self.CMPDEV_MEM_MEDIA = "mem" # mem | brd | nullb
 
         # init.
         self.log_file = log_file
@@ -87,8 +89,9 @@ class Plotter(object):
                         (self.out_dir, os.path.basename(gp_file)),
                         shell=True)
 
-    def _plot_header(self):
-        n_unit = len(self.config["media"]) * len(self.config["bench"])
+    def _plot_header(self, n_unit = None):
+        if n_unit is None:
+            n_unit = len(self.config["media"]) * len(self.config["bench"])
         n_col = min(n_unit, int(self.PAPER_WIDTH / self.UNIT_WIDTH))
         n_row = math.ceil(float(n_unit) / float(n_col))
         print("set term pdfcairo size %sin,%sin font \',10\'" %
@@ -107,8 +110,13 @@ class Plotter(object):
 
     def _plot_sc_data(self, media, bench, iomode):
         def _get_sc_style(fs):
+            if has_err:
+                return "with yerrorlines ps 0.5"
             return "with lp ps 0.5"
 
+        def _get_sc_using(fs):
+            return "1:2:3" if has_err else "1:2"
+
         def _get_data_file(fs):
             return "%s:%s:%s:%s.dat" % (media, fs, bench, iomode)
 
@@ -118,6 +126,8 @@ class Plotter(object):
             return
 
         # gen sc data files
+        # - ncpu works/sec(mean) ci95 min max
+        has_err = False
         for fs in fs_list:
             data = self.parser.search_data([media, fs, bench, "*", iomode])
             if data == []:
@@ -127,10 +137,17 @@ class Plotter(object):
                 print("# %s:%s:%s:%s:*" % (media, fs, bench, iomode), file=out)
                 for d_kv in data:
                     d_kv = d_kv[1]
+                    if "works/sec" not in d_kv: # e.g., TIMEOUT
+                        continue
                     if int(d_kv["ncpu"]) > self.ncore:
                         break
-                    print("%s %s" %
-                          (d_kv["ncpu"], float(d_kv["works/sec"])/self.UNIT),
+                    if int(d_kv.get("nsamples", 1)) > 1:
+                        has_err = True
+                    print("%s %s %s %s %s" %
+                          (d_kv["ncpu"], float(d_kv["works/sec"])/self.UNIT,
+                           float(d_kv["works/sec.ci95"])/self.UNIT,
+                           float(d_kv["works/sec.min"])/self.UNIT,
+                           float(d_kv["works/sec.max"])/self.UNIT),
                           file=out)
         
         # gen gp file
@@ -140,15 +157,79 @@ class Plotter(object):
         print("set ylabel \'%s\'" % "M ops/sec", file=self.out)
 
         fs = fs_list[0]
-        print("plot [0:][0:] \'%s\' using 1:2 title \'%s\' %s"
-              % (_get_data_file(fs), fs, _get_sc_style(fs)),
+        print("plot [0:][0:] \'%s\' using %s title \'%s\' %s"
+              % (_get_data_file(fs), _get_sc_using(fs), fs, _get_sc_style(fs)),
               end="", file=self.out)
         for fs in fs_list[1:]:
-            print(", \'%s\' using 1:2 title \'%s\' %s"
-                  % (_get_data_file(fs), fs, _get_sc_style(fs)),
+            print(", \'%s\' using %s title \'%s\' %s"
+                  % (_get_data_file(fs), _get_sc_using(fs), fs, _get_sc_style(fs)),
                   end="", file=self.out)
         print("", file=self.out)
 
+    def _get_ts_files(self):
+        # time series are written next to the log file
+        log_dir = os.path.dirname(os.path.abspath(self.log_file))
+        return sorted(glob.glob(os.path.join(log_dir, "*.ts")))
+
+    def _plot_ts_data(self, ts_file):
+        # {media}.{fs}.{bench}.{ncore}.{iomode}.{repetition}.ts
+        name = os.path.basename(ts_file)[:-len(".ts")]
+        data_file = "%s.ts.dat" % name
+        with open(os.path.join(self.out_dir, data_file), "w") as out:
+            print("# secs works/sec", file=out)
+            for d_kv in self.parser.parse_ts(ts_file):
+                print("%s %s" %
+                      (d_kv["secs"], float(d_kv["works/sec"])/self.UNIT),
+                      file=out)
+
+        print("", file=self.out)
+        print("set title \'%s\'" % name.replace(".", ":"), file=self.out)
+        print("set xlabel \'time (sec)\'", file=self.out)
+        print("set ylabel \'%s\'" % "M ops/sec", file=self.out)
+        print("plot [0:][0:] \'%s\' using 1:2 notitle with lines"
+              % data_file, file=self.out)
+
+    def _get_percpu_files(self, media, fs, bench, iomode):
+        # {media}.{fs}.{bench}.{ncore}.{iomode}.{repetition}.pm.percpu
+        # -> [(ncore, [files of repetitions])], sorted by ncore
+        log_dir = os.path.dirname(os.path.abspath(self.log_file))
+        files = glob.glob(os.path.join(log_dir, "%s.%s.%s.*.%s.*.pm.percpu" %
+                                       (media, fs, bench, iomode)))
+        ncore_files = {}
+        for f in files:
+            ncore = int(os.path.basename(f).split(".")[-5])
+            ncore_files.setdefault(ncore, []).append(f)
+        return sorted(ncore_files.items())
+
+    def _plot_percpu_data(self, media, fs, bench, iomode):
+        # x: ncore, y: cpu, color: busy (100 - idle.util)
+        # averaged over repetitions
+        percpu_files = self._get_percpu_files(media, fs, bench, iomode)
+        name = "%s.%s.%s.%s" % (media, fs, bench, iomode)
+        data_file = "%s.percpu.dat" % name
+        with open(os.path.join(self.out_dir, data_file), "w") as out:
+            print("# x cpu busy.util ncore", file=out)
+            for (x, (ncore, files)) in enumerate(percpu_files):
+                busy = {}
+                for percpu_file in sorted(files):
+                    for d_kv in self.parser.parse_percpu(percpu_file):
+                        busy.setdefault(d_kv["cpu"], []).append(
+                            100.0 - float(d_kv["idle.util"]))
+                for (cpu, vals) in busy.items():
+                    print("%s %s %s %s" %
+                          (x, cpu, sum(vals) / len(vals), ncore), file=out)
+
+        print("", file=self.out)
+        print("set title '%s'" % name.replace(".", ":"), file=self.out)
+        print("set xlabel '# cores'", file=self.out)
+        print("set ylabel 'cpu'", file=self.out)
+        print("set cbrange [0:100]", file=self.out)
+        print("set palette defined (0 'white', 50 'orange', 100 'red')",
+              file=self.out)
+        print("plot [-0.5:%s-0.5][-0.5:] '%s' using 1:2:3:xtic(4) notitle "
+              "with points pt 5 ps 0.5 palette"
+              % (max(len(percpu_files), 1), data_file), file=self.out)
+
     def _plot_util_data(self, media, ncore, bench, iomode):
         print("", file=self.out)
         print("set grid y", file=self.out)
@@ -189,6 +270,8 @@ class Plotter(object):
                 if data is None:
                     continue
                 d_kv = data[0][1]
+                if "works/sec" not in d_kv: # e.g., TIMEOUT
+                    continue
 
                 print("  \"%s\"" % fs, end="", file=self.out)
                 for util in self.CPU_UTILS:
@@ -211,6 +294,39 @@ class Plotter(object):
         self.out.close()
         self._gen_pdf(self.out_file)
 
+    def plot_ts(self, out_dir):
+        self.out_dir  = out_dir
+        subprocess.call("mkdir -p %s" % self.out_dir, shell=True)
+        self.out_file = os.path.join(self.out_dir, "ts.gp")
+        self.out = open(self.out_file, "w")
+        ts_files = self._get_ts_files()
+        self._gen_log_info()
+        self._plot_header(max(len(ts_files), 1))
+        for ts_file in ts_files:
+            self._plot_ts_data(ts_file)
+        self._plot_footer()
+        self.out.close()
+        self._gen_pdf(self.out_file)
+
+    def plot_percpu(self, out_dir):
+        self.out_dir  = out_dir
+        subprocess.call("mkdir -p %s" % self.out_dir, shell=True)
+        self.out_file = os.path.join(self.out_dir, "percpu.gp")
+        self.out = open(self.out_file, "w")
+        units = [(media, fs, bench, iomode)
+                 for media in self.config["media"]
+                 for fs in self.config["fs"]
+                 for bench in self.config["bench"]
+                 for iomode in self.config["iomode"]
+                 if self._get_percpu_files(media, fs, bench, iomode)]
+        self._gen_log_info()
+        self._plot_header(max(len(units), 1))
+        for (media, fs, bench, iomode) in units:
+            self._plot_percpu_data(media, fs, bench, iomode)
+        self._plot_footer()
+        self.out.close()
+        self._gen_pdf(self.out_file)
+
     def plot_util(self, ncore, out_dir):
         self.out_dir  = out_dir
         subprocess.call("mkdir -p %s" % self.out_dir, shell=True)
@@ -227,19 +343,20 @@ class Plotter(object):
         self._gen_pdf(self.out_file)
 
     def _gen_cmpdev_for_bench(self, ncore, bench):
+        mem = self.CMPDEV_MEM_MEDIA
         # for each file system
         print("## %s" % bench, file=self.out)
-        print("# fs ssd-rel hdd-rel mem ssd hdd", file=self.out)
-        for fs in self._get_fs_list("*", bench):
+        print("# fs ssd-rel hdd-rel %s ssd hdd" % mem, file=self.out)
+        for fs in self._get_fs_list("*", bench, "*"):
             data = self.parser.search_data(["*", fs, bench, "%s" % ncore])
             dev_val = {}
             for d_kv in data:
                 dev = d_kv[0][0]
                 dev_val[dev] = d_kv[1]
             # XXX: ugly [[[
-            if dev_val.get("mem", None) == None:
+            if dev_val.get(mem, None) == None:
                 print("WARNING: there is no %s:%s:%s:%s result." %
-                      ("mem", fs, bench, ncore), file=sys.stderr)
+                      (mem, fs, bench, ncore), file=sys.stderr)
                 continue
             if dev_val.get("ssd", None) == None:
                 print("WARNING: there is no %s:%s:%s:%s result." %
@@ -249,8 +366,14 @@ class Plotter(object):
                 print("WARNING: there is no %s:%s:%s:%s result." %
                       ("hdd", fs, bench, ncore), file=sys.stderr)
                 continue
+            timeout = [dev for dev in (mem, "ssd", "hdd")
+                       if "works/sec" not in dev_val[dev]] # e.g., TIMEOUT
+            if timeout:
+                print("WARNING: there is no works/sec of %s:%s:%s:%s." %
+                      (",".join(timeout), fs, bench, ncore), file=sys.stderr)
+                continue
             # fs ssd-rel hdd-rel mem ssd hdd 
-            mem_perf = float(dev_val["mem"]["works/sec"])
+            mem_perf = float(dev_val[mem]["works/sec"])
             ssd_perf = float(dev_val["ssd"]["works/sec"])
             hdd_perf = float(dev_val["hdd"]["works/sec"])
             print("%s %s %s %s %s %s" %
@@ -275,15 +398,16 @@ class Plotter(object):
 def __print_usage():
     print("Usage: plotter.py --log [log file] ")
     print("                  --gp [gnuplot output]")
-    print("                  --ty [sc | util]")
+    print("                  --ty [sc | util | ts | percpu]")
     print("                  --ncore [# core (only for util)]")
 
 if __name__ == "__main__":
     parser = optparse.OptionParser()
     parser.add_option("--log",   help="Log file")
-    parser.add_option("--ty",    help="{sc | util | cmpdev }")
+    parser.add_option("--ty",    help="{sc | util | cmpdev | ts | percpu}")
     parser.add_option("--out",   help="output directory")
     parser.add_option("--ncore", help="# core (only for utilization and cmpdev)", default="1")
+    parser.add_option("--mem",   help="in-memory media to compare with (only for cmpdev) {mem | brd | nullb}", default="mem")
     (opts, args) = parser.parse_args()
 
     # check arg
@@ -299,7 +423,12 @@ if __name__ == "__main__":
         plotter.plot_sc(opts.out)
     elif opts.ty == "util":
         plotter.plot_util(int(opts.ncore), opts.out)
+    elif opts.ty == "ts":
+        plotter.plot_ts(opts.out)
+    elif opts.ty == "percpu":
+        plotter.plot_percpu(opts.out)
     elif opts.ty == "cmpdev":
+        plotter.CMPDEV_MEM_MEDIA = opts.mem
         plotter.gen_cmpdev(int(opts.ncore), opts.out)
     else:
         __print_usage()
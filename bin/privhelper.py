@@ -0,0 +1,524 @@
+#!/usr/bin/env python3
+import os
+import re
+import sys
+import json
+import stat
+import signal
+import errno
+import ctypes
+import socket
+import socketserver
+import subprocess
+import tempfile
+import threading
+import time
+
+CUR_DIR = os.path.abspath(os.path.dirname(__file__))
+
+'''
+# NOTE
+- PrivHelper is a long-lived root process which performs privileged
+  operations (mount, mkfs, losetup, drop caches, cpu hotplug, ...)
+  on behalf of the benchmark harness. The harness talks to it over
+  a unix domain socket, so the latency of spawning a shell and sudo
+  for every operation is paid only once per campaign.
+- Each request and reply is a single line of JSON.
+  - request: {"op":"mount", "source":..., "target":..., "fstype":...}
+  - reply:   {"ok":true, "ret":...}
+             {"ok":false, "errno":..., "error":"..."}
+- Sub-processes started by the harness (e.g., perfmon.py) find the
+  helper through $PRIVHELPER_SOCK.
+- There is no operation to run an arbitrary command; operations check
+  their arguments (e.g., allowed modules, procfs files, block devices).
+'''
+
+class PrivHelperError(Exception):
+    def __init__(self, op, err, msg):
+        super(PrivHelperError, self).__init__(op, err, msg)
+        (self.op, self.errno, self.msg) = (op, err, msg)
+
+    def __str__(self):
+        return "%s: [errno %s] %s" % (self.op, self.errno, self.msg)
+
+class PrivHelper(object):
+    SOCK_ENV   = "PRIVHELPER_SOCK"
+    START_WAIT = 60 # seconds, including a sudo password prompt
+
+    def __init__(self, sock_path = os.environ.get(SOCK_ENV, None)):
+        self.sock_path = sock_path
+        self.sock = None
+        self.rfd  = None
+        self.proc = None
+
+    # server management
+    def start(self):
+        sock_dir = tempfile.mkdtemp(prefix="fxmark-privhelper-")
+        self.sock_path = os.path.join(sock_dir, "sock")
+        self.proc = subprocess.Popen(["sudo", os.path.join(CUR_DIR, "privhelper.py"),
+                                      "serve", self.sock_path, str(os.getuid())])
+        deadline = time.time() + PrivHelper.START_WAIT
+        while time.time() < deadline:
+            if self.proc.poll() is not None:
+                break
+            try:
+                self.connect()
+                return
+            except (FileNotFoundError, ConnectionRefusedError):
+                time.sleep(0.05)
+        raise PrivHelperError("start", errno.ETIMEDOUT,
+                              "privileged helper is not responding")
+
+    def stop(self):
+        if self.proc is None:
+            return
+        try:
+            self.call("quit")
+        except (PrivHelperError, OSError):
+            pass
+        self.close()
+        self.proc.wait()
+        self.proc = None
+        try:
+            os.rmdir(os.path.dirname(self.sock_path))
+        except OSError:
+            pass
+
+    def connect(self):
+        sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        try:
+            sock.connect(self.sock_path)
+        except OSError:
+            sock.close()
+            raise
+        (self.sock, self.rfd) = (sock, sock.makefile("rb"))
+
+    def close(self):
+        if self.sock:
+            self.rfd.close()
+            self.sock.close()
+        (self.sock, self.rfd) = (None, None)
+
+    def env(self):
+        return "%s=%s" % (PrivHelper.SOCK_ENV, self.sock_path)
+
+    def call(self, op, **args):
+        if not self.sock:
+            self.connect()
+        args["op"] = op
+        self.sock.sendall((json.dumps(args) + '\n').encode("utf-8"))
+        line = self.rfd.readline()
+        if not line:
+            self.close()
+            raise PrivHelperError(op, errno.EPIPE,
+                                  "privileged helper has gone")
+        reply = json.loads(line.decode("utf-8"))
+        if not reply["ok"]:
+            raise PrivHelperError(op, reply["errno"], reply["error"])
+        return reply.get("ret", None)
+
+    # typed operations
+    def mount(self, source, target, fstype, data = ""):
+        return self.call("mount", source=source, target=target,
+                         fstype=fstype, data=data)
+
+    def umount(self, target, force = False):
+        return self.call("umount", target=target, force=force)
+
+    def mkfs(self, fstype, opts, dev):
+        return self.call("mkfs", fstype=fstype, opts=opts, dev=dev)
+
+    def losetup_attach(self, img, sector_size = 0, direct_io = False):
+        return self.call("losetup_attach", img=img, sector_size=sector_size,
+                         direct_io=direct_io)
+
+    def losetup_detach(self, dev):
+        return self.call("losetup_detach", dev=dev)
+
+    def drop_caches(self):
+        return self.call("drop_caches")
+
+    def set_cpus(self, cpus):
+        # cpus = None means all cpus
+        return self.call("set_cpus", cpus=cpus)
+
+    def cpuset(self, name, cpus, mems):
+        return self.call("cpuset", name=name, cpus=cpus, mems=mems)
+
+    def cgroup_attach(self, name, pid):
+        return self.call("cgroup_attach", name=name, pid=pid)
+
+    def cgroup_remove(self, name):
+        return self.call("cgroup_remove", name=name)
+
+    def write_sysctl(self, name, value):
+        return self.call("write_sysctl", name=name, value=str(value))
+
+    def read_procfs(self, path):
+        return self.call("read_procfs", path=path)
+
+    def write_tracefs(self, path, value):
+        return self.call("write_tracefs", path=path, value=str(value))
+
+    def read_tracefs(self, path):
+        return self.call("read_tracefs", path=path)
+
+    def chmod(self, path, mode):
+        return self.call("chmod", path=path, mode=mode)
+
+    def wipe(self, path, nproc, keep = ()):
+        return self.call("wipe", path=path, nproc=nproc, keep=list(keep))
+
+    def load_module(self, name, params = ()):
+        return self.call("load_module", name=name, params=list(params))
+
+    def unload_module(self, name):
+        return self.call("unload_module", name=name)
+
+    def write_procfs(self, path, value):
+        return self.call("write_procfs", path=path, value=str(value))
+
+    def ext4_remove_journal(self, dev):
+        return self.call("ext4_remove_journal", dev=dev)
+
+    def dev_geometry(self, dev):
+        # (size in bytes, logical sector size)
+        return tuple(self.call("dev_geometry", dev=dev))
+
+    def discard(self, dev):
+        return self.call("discard", dev=dev)
+
+    def restore_fsimg(self, img, dev):
+        return self.call("restore_fsimg", img=img, dev=dev)
+
+    def kill_tree(self, pid):
+        return self.call("kill_tree", pid=pid)
+
+class PrivHelperServer(socketserver.ThreadingMixIn,
+                       socketserver.UnixStreamServer):
+    daemon_threads = True
+    CPU_SYSFS = "/sys/devices/system/cpu"
+    CGROUP_FS = "/sys/fs/cgroup"
+    TRACEFS   = ("/sys/kernel/tracing/", "/sys/kernel/debug/tracing/")
+    MNT_FORCE  = 1
+    MNT_DETACH = 2
+    MODULES = ("brd", "null_blk") # in-memory block devices
+    MODULE_PARAM = re.compile(r"^\w+=[\w.,-]*$")
+    PROCFS_WRITABLE = ("/proc/lock_stat",)
+    RESTORE_FSIMG = os.path.join(CUR_DIR, "restore-fsimg")
+
+    def __init__(self, sock_path, owner_uid):
+        socketserver.UnixStreamServer.__init__(self, sock_path,
+                                               PrivHelperRequestHandler)
+        os.chown(sock_path, owner_uid, -1)
+        os.chmod(sock_path, 0o600)
+        self.sock_path = sock_path
+        self.quit_requested = False
+        self.libc = ctypes.CDLL(None, use_errno=True)
+        self.HOWTO_OP = {
+            "mount":self.op_mount,
+            "umount":self.op_umount,
+            "mkfs":self.op_mkfs,
+            "losetup_attach":self.op_losetup_attach,
+            "losetup_detach":self.op_losetup_detach,
+            "drop_caches":self.op_drop_caches,
+            "set_cpus":self.op_set_cpus,
+            "cpuset":self.op_cpuset,
+            "cgroup_attach":self.op_cgroup_attach,
+            "cgroup_remove":self.op_cgroup_remove,
+            "write_sysctl":self.op_write_sysctl,
+            "read_procfs":self.op_read_procfs,
+            "write_tracefs":self.op_write_tracefs,
+            "read_tracefs":self.op_read_tracefs,
+            "chmod":self.op_chmod,
+            "wipe":self.op_wipe,
+            "load_module":self.op_load_module,
+            "unload_module":self.op_unload_module,
+            "write_procfs":self.op_write_procfs,
+            "ext4_remove_journal":self.op_ext4_remove_journal,
+            "dev_geometry":self.op_dev_geometry,
+            "discard":self.op_discard,
+            "restore_fsimg":self.op_restore_fsimg,
+            "kill_tree":self.op_kill_tree,
+            "quit":self.op_quit,
+        }
+
+    def dispatch(self, req):
+        op_fn = self.HOWTO_OP.get(req.get("op", None), None)
+        if not op_fn:
+            return {"ok":False, "errno":errno.EINVAL,
+                    "error":"unknown operation: %s" % req.get("op", None)}
+        try:
+            return {"ok":True, "ret":op_fn(req)}
+        except OSError as e:
+            msg = e.strerror if e.strerror else str(e)
+            if e.filename:
+                msg = "%s: %s" % (msg, e.filename)
+            return {"ok":False, "errno":e.errno, "error":msg}
+
+    def _libc_err(self, fn_name, path):
+        err = ctypes.get_errno()
+        return OSError(err, "%s: %s" % (fn_name, os.strerror(err)), path)
+
+    def _run(self, argv):
+        p = subprocess.Popen(argv, stdout=subprocess.PIPE,
+                             stderr=subprocess.PIPE)
+        (out, err) = p.communicate()
+        if p.returncode != 0:
+            msg = err.decode("utf-8", "replace").strip().splitlines()
+            raise OSError(errno.EIO, "%s exited with %d: %s" %
+                          (argv[0], p.returncode, msg[-1] if msg else ""))
+        return out.decode("utf-8", "replace")
+
+    # operations
+    def op_mount(self, req):
+        rc = self.libc.mount(req["source"].encode(), req["target"].encode(),
+                             req["fstype"].encode(), ctypes.c_ulong(0),
+                             req["data"].encode() if req["data"] else None)
+        if rc != 0:
+            raise self._libc_err("mount", req["target"])
+
+    def op_umount(self, req):
+        # unmount all file systems stacked on the target
+        # - force: abort pending requests and detach even if busy
+        flags = 0
+        if req.get("force", False):
+            flags = PrivHelperServer.MNT_FORCE | PrivHelperServer.MNT_DETACH
+        cnt = 0
+        while self.libc.umount2(req["target"].encode(), flags) == 0:
+            cnt += 1
+        err = ctypes.get_errno()
+        if err not in (errno.EINVAL, errno.ENOENT):
+            raise self._libc_err("umount", req["target"])
+        return cnt
+
+    def op_mkfs(self, req):
+        return self._run(["mkfs.%s" % req["fstype"]] + req["opts"] +
+                         [req["dev"]])
+
+    def op_losetup_attach(self, req):
+        argv = ["losetup", "-f", "--show"]
+        if req["sector_size"]:
+            argv += ["--sector-size", str(req["sector_size"])]
+        if req.get("direct_io", False):
+            argv += ["--direct-io=on"]
+        return self._run(argv + [req["img"]]).strip()
+
+    def op_losetup_detach(self, req):
+        self._run(["losetup", "-d", req["dev"]])
+
+    def op_drop_caches(self, req):
+        os.sync()
+        with open("/proc/sys/vm/drop_caches", "w") as fd:
+            fd.write("3")
+
+    def _read_cpu_set(self, name):
+        with open(os.path.join(PrivHelperServer.CPU_SYSFS, name)) as fd:
+            cpus = set()
+            for r in fd.read().strip().split(","):
+                if not r:
+                    continue
+                (beg, _, end) = r.partition("-")
+                cpus.update(range(int(beg), int(end or beg) + 1))
+            return cpus
+
+    def op_set_cpus(self, req):
+        present = self._read_cpu_set("present")
+        want_online = present if req["cpus"] is None else set(req["cpus"])
+        bad = want_online - present
+        if bad:
+            raise OSError(errno.ENODEV, "CPU(s) %s are not present" %
+                          ','.join(map(str, sorted(bad))))
+        online = self._read_cpu_set("online")
+        for cpu in sorted(present):
+            if (cpu in want_online) == (cpu in online):
+                continue
+            path = os.path.join(PrivHelperServer.CPU_SYSFS,
+                                "cpu%d" % cpu, "online")
+            with open(path, "w") as fd:
+                fd.write("1" if cpu in want_online else "0")
+
+    def _write_cgroup(self, name, key, value):
+        with open(os.path.join(PrivHelperServer.CGROUP_FS, name, key), "w") as fd:
+            fd.write(value)
+
+    def op_cpuset(self, req):
+        # create or update a cgroup v2 cpuset
+        self._write_cgroup("", "cgroup.subtree_control", "+cpuset")
+        path = os.path.join(PrivHelperServer.CGROUP_FS, req["name"])
+        if not os.path.isdir(path):
+            os.mkdir(path)
+        self._write_cgroup(req["name"], "cpuset.cpus",
+                           ','.join(map(str, req["cpus"])))
+        if req["mems"]:
+            self._write_cgroup(req["name"], "cpuset.mems",
+                               ','.join(map(str, req["mems"])))
+
+    def op_cgroup_attach(self, req):
+        self._write_cgroup(req["name"], "cgroup.procs", str(req["pid"]))
+
+    def op_cgroup_remove(self, req):
+        path = os.path.join(PrivHelperServer.CGROUP_FS, req["name"])
+        if os.path.isdir(path):
+            os.rmdir(path)
+
+    def op_write_sysctl(self, req):
+        path = os.path.join("/proc/sys", req["name"].replace(".", "/"))
+        with open(path, "w") as fd:
+            fd.write(req["value"])
+
+    def op_read_procfs(self, req):
+        path = os.path.normpath(req["path"])
+        if not path.startswith("/proc/"):
+            raise OSError(errno.EPERM, "not a procfs file", path)
+        with open(path) as fd:
+            return fd.read()
+
+    def _tracefs_path(self, path):
+        path = os.path.normpath(path)
+        if not path.startswith(PrivHelperServer.TRACEFS):
+            raise OSError(errno.EPERM, "not a tracefs file", path)
+        return path
+
+    def op_write_tracefs(self, req):
+        # tracefs control files (e.g., trigger) take a command per
+        # write and are appended to like 'echo ... >> trigger'
+        with open(self._tracefs_path(req["path"]), "a") as fd:
+            fd.write(req["value"])
+
+    def op_read_tracefs(self, req):
+        with open(self._tracefs_path(req["path"])) as fd:
+            return fd.read()
+
+    def op_chmod(self, req):
+        os.chmod(req["path"], req["mode"])
+
+    def op_wipe(self, req):
+        # remove all entries under a directory with nproc rm processes
+        path = req["path"]
+        entries = [os.path.join(path, e) for e in os.listdir(path)
+                   if e not in req["keep"]]
+        procs = []
+        while entries or procs:
+            while entries and len(procs) < req["nproc"]:
+                procs.append(subprocess.Popen(["rm", "-rf", entries.pop()]))
+            procs.pop(0).wait()
+        os.sync()
+
+    def _module(self, name):
+        if name not in PrivHelperServer.MODULES:
+            raise OSError(errno.EPERM, "not an allowed module", name)
+        return name
+
+    def op_load_module(self, req):
+        bad = [p for p in req["params"]
+               if not PrivHelperServer.MODULE_PARAM.match(p)]
+        if bad:
+            raise OSError(errno.EINVAL, "bad module parameter",
+                          ' '.join(bad))
+        self._run(["modprobe", self._module(req["name"])] + req["params"])
+
+    def op_unload_module(self, req):
+        self._run(["modprobe", "-r", self._module(req["name"])])
+
+    def op_write_procfs(self, req):
+        path = os.path.normpath(req["path"])
+        if path not in PrivHelperServer.PROCFS_WRITABLE:
+            raise OSError(errno.EPERM, "not a writable procfs file", path)
+        with open(path, "w") as fd:
+            fd.write(req["value"])
+
+    def _block_dev(self, path):
+        if not stat.S_ISBLK(os.stat(path).st_mode):
+            raise OSError(errno.ENOTBLK, "not a block device", path)
+        return path
+
+    def op_ext4_remove_journal(self, req):
+        self._run(["tune2fs", "-O", "^has_journal",
+                   self._block_dev(req["dev"])])
+
+    def op_dev_geometry(self, req):
+        vals = self._run(["blockdev", "--getsize64", "--getss",
+                          self._block_dev(req["dev"])]).split()
+        return [int(vals[0]), int(vals[1])]
+
+    def op_discard(self, req):
+        self._run(["blkdiscard", self._block_dev(req["dev"])])
+
+    def op_restore_fsimg(self, req):
+        if not os.path.isfile(req["img"]):
+            raise OSError(errno.ENOENT, "no image file", req["img"])
+        self._run([PrivHelperServer.RESTORE_FSIMG, req["img"],
+                   self._block_dev(req["dev"])])
+
+    def _get_proc_tree(self):
+        # pid -> (ppid, pgid) of all processes
+        procs = {}
+        for pid in filter(str.isdigit, os.listdir("/proc")):
+            try:
+                with open("/proc/%s/stat" % pid) as fd:
+                    stat = fd.read()
+            except IOError:
+                continue
+            # comm may contain spaces so parse after the last ')'
+            fields = stat[stat.rfind(")") + 2:].split()
+            procs[int(pid)] = (int(fields[1]), int(fields[2]))
+        return procs
+
+    def op_kill_tree(self, req):
+        # kill a process, its descendants, and its process group
+        # (e.g., a child of a benchmark that is re-parented to init
+        # stays in the process group); perf of PerfMon runs in its
+        # own session and is stopped by 'perfmon.py stop' instead
+        procs = self._get_proc_tree()
+        pgid = procs.get(req["pid"], (0, 0))[1]
+        if pgid != req["pid"]:
+            pgid = 0 # not a group leader; do not kill our caller's group
+        victims = set([req["pid"]])
+        while True:
+            more = set(pid for (pid, (ppid, pg)) in procs.items()
+                       if pid not in victims and
+                       (ppid in victims or (pgid and pg == pgid)))
+            if not more:
+                break
+            victims |= more
+        victims.discard(os.getpid())
+        for pid in victims:
+            try:
+                os.kill(pid, signal.SIGKILL)
+            except ProcessLookupError:
+                pass
+        return len(victims)
+
+    def op_quit(self, req):
+        self.quit_requested = True
+
+class PrivHelperRequestHandler(socketserver.StreamRequestHandler):
+    def handle(self):
+        for line in self.rfile:
+            reply = self.server.dispatch(json.loads(line.decode("utf-8")))
+            self.wfile.write((json.dumps(reply) + '\n').encode("utf-8"))
+            self.wfile.flush()
+            if self.server.quit_requested:
+                # shutdown() waits for serve_forever() so do not block here
+                threading.Thread(target=self.server.shutdown).start()
+                break
+
+def __print_usage():
+    print("Usage: privhelper.py serve {socket path} {owner uid}")
+
+if __name__ == "__main__":
+    if len(sys.argv) != 4 or sys.argv[1] != "serve":
+        __print_usage()
+        exit(1)
+    # the harness cleans up on ctrl-C through the helper,
+    # so the helper should survive it.
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    if os.path.exists(sys.argv[2]):
+        os.unlink(sys.argv[2])
+    server = PrivHelperServer(sys.argv[2], int(sys.argv[3]))
+    try:
+        server.serve_forever()
+    finally:
+        server.server_close()
+        os.unlink(server.sock_path)
@@ -59,16 +59,16 @@ class DBench(object):
         with tempfile.NamedTemporaryFile(delete=False) as self.bench_out:
             cmd = "sudo dbench %s -t %s -c %s -D %s" % (self.ncore, self.duration, self.get_config(), self.root)
             p = self._exec_cmd(cmd, subprocess.PIPE)
-            while True:
-                for l in p.stdout.readlines():
-                    self.bench_out.write("#@ ".encode("utf-8"))
-                    self.bench_out.write(l)
-                    l_str = str(l)
-                    idx = l_str.find(DBench.PERF_STR)
-                    if idx is not -1:
-                        self.perf_msg = l_str[idx+len(DBench.PERF_STR):]
-                if self.perf_msg:
-                    break
+            for l in p.stdout:
+                self.bench_out.write("#@ ".encode("utf-8"))
+                self.bench_out.write(l)
+                l_str = str(l)
+                idx = l_str.find(DBench.PERF_STR)
+                if idx is not -1:
+                    self.perf_msg = l_str[idx+len(DBench.PERF_STR):]
+            # the output ends when the benchmark exits, so do not spin
+            # waiting for a summary line which may never come
+            p.wait()
             self.bench_out.flush()
 
     def report(self):
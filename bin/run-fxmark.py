@@ -5,9 +5,15 @@ import signal
 import subprocess
 import datetime
 import tempfile
+import hashlib
+import optparse
+import time
 import pdb
+import glob
 from os.path import join
 from perfmon import PerfMon
+from privhelper import PrivHelper, PrivHelperError
+from campaign import Campaign, SetupCost, Planner, Journal
 
 CUR_DIR = os.path.abspath(os.path.dirname(__file__))
 
@@ -19,16 +25,41 @@ except ImportError:
           % os.path.normpath(os.path.join(CUR_DIR, "..")))
     raise
 
+def size_to_bytes(size):
+    # "32G" -> 34359738368
+    units = {"K":2**10, "M":2**20, "G":2**30, "T":2**40}
+    size = str(size).strip().upper()
+    if size[-1] in units:
+        return int(float(size[:-1]) * units[size[-1]])
+    return int(size)
+
+def get_machine_id():
+    return {"SYSTEM":' '.join(os.uname()),
+            "MODEL_NAME":cpupol.MODEL_NAME,
+            "PHYSICAL_CHIPS":cpupol.PHYSICAL_CHIPS,
+            "CORE_PER_CHIP":cpupol.CORE_PER_CHIP,
+            "SMT_LEVEL":cpupol.SMT_LEVEL,
+            "CORE_SEQ":list(cpupol.seq_cores)}
+
 def catch_ctrl_C(sig, frame):
     print("Umount a testing file system. Please wait.")
 
 class Runner(object):
     # media path
-    LOOPDEV = "/dev/loopX"
     NVMEDEV = "/dev/nvme0n1pX"
     HDDDEV  = "/dev/sdX"
     SSDDEV  = "/dev/sdY"
 
+    # in-memory block devices
+    BRDDEV   = "/dev/ram0"
+    NULLBDEV = "/dev/nullb0"
+
+    # cgroup for CPU_RESTRICT = "cpuset"
+    CGROUP_NAME = "fxmark"
+
+    # seconds to wait for a killed benchmark to exit
+    KILL_WAIT = 10
+
     # test core granularity
     CORE_FINE_GRAIN   = 0
     CORE_COARSE_GRAIN = 1
@@ -41,12 +72,34 @@ class Runner(object):
         self.CORE_GRAIN    = core_grain
         self.PERFMON_LEVEL = pfm_lvl
         self.FILTER        = run_filter # media, fs, bench, ncore, directio
+        self.SKIP_CONFIG   = set() # (media, fs, bench, ncore, directio)
         self.DRYRUN        = False
+        self.RESUME_DIR    = None # log directory of an interrupted run
+        self.RUN_INDEX     = 0 # index of this runner in a campaign
+        self.CPU_RESTRICT  = "hotplug" # hotplug | cpuset (cgroup v2)
         self.DEBUG_OUT     = False
 
         # bench config
         self.DISK_SIZE     = "32G"
+        self.MEM_DISK_ALLOC  = "sparse" # sparse | fallocate
+        self.LOOP_DIRECT_IO  = True
+        self.LOOP_BLOCK_SIZE = 512  # logical block size of a loop device
+        self.BRD_SIZE        = self.DISK_SIZE
+        self.BRD_COUNT       = 1
+        self.NULLB_SIZE      = self.DISK_SIZE
+        self.NULLB_QUEUE_MODE      = 2 # 0: bio, 1: rq, 2: multi-queue
+        self.NULLB_COMPLETION_NSEC = 0 # 0: complete immediately
+        self.MKFS_CACHE    = True # restore a cached mkfs image instead of mkfs
+        self.MOUNT_REUSE   = False # keep fs mounted across configs of the same (media, fs, directio)
         self.DURATION      = 30 # seconds
+        self.WARMUP        = 0 # seconds of fxmark run before DURATION, excluded from results
+        self.TIMEOUT_SLACK = 300 # seconds beyond DURATION before a bench is killed (None: no timeout)
+        self.REPETITIONS   = 1
+        self.CONVERGE      = 0 # stop fxmark when relative 95% CI of throughput <= CONVERGE (0: run for DURATION)
+        self.MIN_DURATION  = 5 # seconds to run at least with CONVERGE
+        self.SAMPLE_MSECS  = 100 # interval of fxmark works time series (0: disable)
+        self.LATENCY       = False # per-operation latency percentiles of fxmark
+        self.TELEMETRY_MSECS = 1000 # interval of perfmon diskstats/vmstat/meminfo sampling (0: disable)
         self.DIRECTIOS     = ["bufferedio", "directio"]  # enable directio except tmpfs -> nodirectio 
         self.MEDIA_TYPES   = ["ssd", "hdd", "nvme", "mem"]
 #        self.FS_TYPES      = [
@@ -105,6 +158,8 @@ class Runner(object):
         self.FILEBENCH_NAME = "run-filebench.py"
         self.DBENCH_NAME    = "run-dbench.py"
         self.PERFMN_NAME    = "perfmon.py"
+        self.MKFS_CACHE_NAME = ".mkfs-cache"
+        self.SETUP_COST_NAME = ".setup-cost.json"
 
         # fs config
         self.HOWTO_MOUNT = {
@@ -136,6 +191,8 @@ class Runner(object):
             "nvme":self.init_nvme_disk,
             "ssd":self.init_ssd_disk,
             "hdd":self.init_hdd_disk,
+            "brd":self.init_brd_disk,
+            "nullb":self.init_nullb_disk,
         }
 
         # misc. setup
@@ -156,6 +213,11 @@ class Runner(object):
             os.path.join(CUR_DIR, ".tmp"))
         self.disk_path = os.path.normpath(
             os.path.join(self.tmp_path, "disk.img"))
+        self.mkfs_cache_path = os.path.normpath(
+            os.path.join(CUR_DIR, self.MKFS_CACHE_NAME))
+        self.mkfs_version = {}
+        self.setup_cost = SetupCost(os.path.normpath(
+            os.path.join(CUR_DIR, self.SETUP_COST_NAME)))
         self.perfmon_start = "%s start" % os.path.normpath(
             os.path.join(CUR_DIR, self.PERFMN_NAME))
         self.perfmon_stop = "%s stop" % os.path.normpath(
@@ -163,15 +225,28 @@ class Runner(object):
         self.perfmon_log = ""
         self.log_dir     = ""
         self.log_path    = ""
+        self.journal     = None
         self.umount_hook = []
+        self.priv        = PrivHelper()
         self.active_ncore = -1
+        self.mount_group = None
+        self.mount_reused = False
+        self.test_dev    = None # block device mounted at test_root
+        self.bench_timed_out = False
+        self.mem_loopdev = None
+        self.loaded_modules = []
 
     def log_start(self):
+        if self.RESUME_DIR:
+            self.log_resume()
+            return
         self.log_dir = os.path.normpath(
             os.path.join(CUR_DIR, self.LOGD_NAME,
                          str(datetime.datetime.now()).replace(' ','-').replace(':','-')))
         self.log_path = os.path.normpath( os.path.join(self.log_dir, "fxmark.log"))
         self.exec_cmd("mkdir -p " + self.log_dir, self.dev_null)
+        self.journal = Journal(self.log_dir)
+        self.journal.start({"machine":get_machine_id(), "run":self.RUN_INDEX})
 
         self.log_fd = open(self.log_path, "bw")
         p = self.exec_cmd("echo -n \"### SYSTEM         = \"; uname -a", self.redirect)
@@ -179,11 +254,32 @@ class Runner(object):
             for l in p.stdout.readlines():
                 self.log(l.decode("utf-8").strip())
         self.log("### DISK_SIZE      = %s"   % self.DISK_SIZE)
+        self.log("### MEM_DISK       = %s,directio=%s,bs=%s" %
+                 (self.MEM_DISK_ALLOC, self.LOOP_DIRECT_IO,
+                  self.LOOP_BLOCK_SIZE))
         self.log("### DURATION       = %ss"  % self.DURATION)
+        self.log("### WARMUP         = %ss"  % self.WARMUP)
+        self.log("### REPETITIONS    = %s"   % self.REPETITIONS)
+        self.log("### TIMEOUT_SLACK  = %ss"  % self.TIMEOUT_SLACK)
+        self.log("### CONVERGE       = %s,min=%ss" %
+                 (self.CONVERGE, self.MIN_DURATION))
+        self.log("### SAMPLE_MSECS   = %s"   % self.SAMPLE_MSECS)
+        self.log("### LATENCY        = %s"   % self.LATENCY)
+        self.log("### TELEMETRY_MSECS = %s"  % self.TELEMETRY_MSECS)
+        if "brd" in self.MEDIA_TYPES:
+            self.log("### BRD            = size=%s,count=%s" %
+                     (self.BRD_SIZE, self.BRD_COUNT))
+        if "nullb" in self.MEDIA_TYPES:
+            self.log("### NULLB          = size=%s,queue_mode=%s,completion_nsec=%s" %
+                     (self.NULLB_SIZE, self.NULLB_QUEUE_MODE,
+                      self.NULLB_COMPLETION_NSEC))
+        self.log("### MKFS_CACHE     = %s"   % self.MKFS_CACHE)
+        self.log("### MOUNT_REUSE    = %s"   % self.MOUNT_REUSE)
         self.log("### DIRECTIO       = %s"   % ','.join(self.DIRECTIOS))
         self.log("### MEDIA_TYPES    = %s"   % ','.join(self.MEDIA_TYPES))
         self.log("### FS_TYPES       = %s"   % ','.join(self.FS_TYPES))
         self.log("### BENCH_TYPES    = %s"   % ','.join(self.BENCH_TYPES))
+        self.log("### CPU_RESTRICT   = %s"   % self.CPU_RESTRICT)
         self.log("### NCORES         = %s"   % 
                  ','.join(map(lambda c: str(c), self.ncores)))
         self.log("### CORE_SEQ       = %s" % 
@@ -195,6 +291,20 @@ class Runner(object):
         self.log("### SMT_LEVEL      = %s" % cpupol.SMT_LEVEL)
         self.log("\n")
 
+    def log_resume(self):
+        # append to the log of the interrupted run so that Parser sees
+        # one contiguous result set
+        self.log_dir = os.path.normpath(self.RESUME_DIR)
+        self.log_path = os.path.normpath( os.path.join(self.log_dir, "fxmark.log"))
+        self.journal = Journal(self.log_dir)
+        self.journal.load()
+
+        self.log_fd = open(self.log_path, "ba")
+        self.log("\n")
+        self.log("### RESUMED        = %s" % datetime.datetime.now())
+        self.log("### NUM_DONE_CONF  = %d" % len(self.journal.done))
+        self.log("\n")
+
     def log_end(self):
         self.log_fd.close()
 
@@ -216,33 +326,109 @@ class Runner(object):
             ncores.append(n)
         return ncores
 
-    def exec_cmd(self, cmd, out=None):
-        p = subprocess.Popen(cmd, shell=True, stdout=out, stderr=out)
+    def exec_cmd(self, cmd, out=None, preexec_fn=None):
+        p = subprocess.Popen(cmd, shell=True, stdout=out, stderr=out,
+                             preexec_fn=preexec_fn)
         p.wait()
         return p
 
+    def get_bench_secs(self, bench):
+        # expected run time of a benchmark
+        (bin, type) = self.get_bin_type(bench)
+        if bin == self.fxmark_path:
+            return self.WARMUP + self.DURATION
+        return self.DURATION
+
+    def get_deadline(self, bench):
+        if self.TIMEOUT_SLACK is None:
+            return None
+        return self.get_bench_secs(bench) + self.TIMEOUT_SLACK
+
+    def exec_bench(self, cmd, timeout, preexec_fn=None):
+        # run a benchmark in its own session so that a hung one can be
+        # killed with all its children (workers, perf, ...)
+        p = subprocess.Popen(cmd, shell=True, stdout=self.redirect,
+                             stderr=self.dev_null, preexec_fn=preexec_fn,
+                             start_new_session=True)
+        try:
+            (out, err) = p.communicate(timeout=timeout)
+            return (out, False)
+        except subprocess.TimeoutExpired:
+            pass
+        try:
+            self.priv.kill_tree(p.pid)
+        except PrivHelperError as e:
+            self.priv_error(e)
+        try:
+            # a process stuck in the kernel may never die; give up on it
+            p.communicate(timeout=self.KILL_WAIT)
+        except subprocess.TimeoutExpired:
+            print("# WARNING: %s (pid %d) does not exit" % (cmd, p.pid))
+        return (None, True)
+
     def keep_sudo(self):
+        # bench wrappers and perfmon still use sudo by themselves
         self.exec_cmd("sudo -v", self.dev_null)
 
+    def priv_error(self, e):
+        print("# ERROR: %s" % e)
+
     def drop_caches(self):
-        cmd = ' '.join(["sudo", 
-                        os.path.normpath(
-                            os.path.join(CUR_DIR, "drop-caches"))])
-        self.exec_cmd(cmd, self.dev_null)
+        try:
+            self.priv.drop_caches()
+        except PrivHelperError as e:
+            self.priv_error(e)
+
+    def reset_lock_stat(self):
+        try:
+            self.priv.write_sysctl("kernel.lock_stat", 0)
+        except PrivHelperError:
+            # lock_stat is not available without CONFIG_LOCK_STAT
+            pass
 
     def set_cpus(self, ncore):
         if self.active_ncore == ncore:
             return
         self.active_ncore = ncore
+        if self.CPU_RESTRICT == "cpuset":
+            self.set_cpuset(ncore)
+            return
         if ncore is 0:
-            ncores = "all"
+            cpus = None
         else:
-            ncores = ','.join(map(lambda c: str(c), cpupol.seq_cores[0:ncore]))
-        cmd = ' '.join(["sudo", 
-                        os.path.normpath(
-                            os.path.join(CUR_DIR, "set-cpus")), 
-                        ncores])
-        self.exec_cmd(cmd, self.dev_null)
+            cpus = cpupol.seq_cores[0:ncore]
+        try:
+            self.priv.set_cpus(cpus)
+        except PrivHelperError as e:
+            self.priv_error(e)
+
+    def get_numa_nodes(self, cpus):
+        nodes = set()
+        for cpu in cpus:
+            cpu_dir = "/sys/devices/system/cpu/cpu%d" % cpu
+            for d in os.listdir(cpu_dir):
+                if d.startswith("node") and d[4:].isdigit():
+                    nodes.add(int(d[4:]))
+        return sorted(nodes)
+
+    def set_cpuset(self, ncore):
+        # all cpus stay online and benchmark processes are
+        # confined to the first ncore cpus by a cgroup v2 cpuset
+        try:
+            if ncore == 0:
+                self.priv.cgroup_remove(Runner.CGROUP_NAME)
+                return
+            cpus = cpupol.seq_cores[0:ncore]
+            self.priv.set_cpus(None)
+            self.priv.cpuset(Runner.CGROUP_NAME, cpus,
+                             self.get_numa_nodes(cpus))
+        except PrivHelperError as e:
+            self.priv_error(e)
+
+    def enter_cpuset(self):
+        # called in a forked child right before exec
+        PrivHelper(self.priv.sock_path).cgroup_attach(Runner.CGROUP_NAME,
+                                                      os.getpid())
 
     def add_bg_worker_if_needed(self, bench, ncore):
         if bench.endswith(self.BENCH_BG_SFX):
@@ -252,52 +438,104 @@ class Runner(object):
 
     def prepre_work(self, ncore):
         self.keep_sudo()
-        self.exec_cmd("sudo sh -c \"echo 0 >/proc/sys/kernel/lock_stat\"",
-                      self.dev_null)
+        self.reset_lock_stat()
         self.drop_caches()
-        self.exec_cmd("sync", self.dev_null)
         self.set_cpus(ncore)
 
     def pre_work(self):
-        self.keep_sudo()
         self.drop_caches()
 
     def post_work(self):
-        self.keep_sudo()
+        pass
 
-    def unset_loopdev(self):
-        self.exec_cmd(' '.join(["sudo", "losetup", "-d", Runner.LOOPDEV]),
-                      self.dev_null)
-
-    def umount(self, where):
-        while True:
-            p = self.exec_cmd("sudo umount " + where, self.dev_null)
-            if p.returncode is not 0:
-                break
+    def umount(self, where, force=False):
+        try:
+            self.priv.umount(where, force)
+        except PrivHelperError as e:
+            self.priv_error(e)
         (umount_hook, self.umount_hook) = (self.umount_hook, [])
-        map(lambda hook: hook(), umount_hook);
+        for hook in umount_hook:
+            hook()
 
     def init_mem_disk(self):
-        self.unset_loopdev()
+        # a loop device on a tmpfs file is set up once and
+        # reused across configs until deinit_mem_disk()
+        if self.mem_loopdev:
+            return (True, self.mem_loopdev)
         self.umount(self.tmp_path)
-        self.unset_loopdev()
         self.exec_cmd("mkdir -p " + self.tmp_path, self.dev_null)
         if not self.mount_tmpfs("mem", "tmpfs", self.tmp_path):
-            return False;
-        self.exec_cmd("dd if=/dev/zero of=" 
-                      + self.disk_path +  " bs=1G count=1024000",
-                      self.dev_null)
-        p = self.exec_cmd(' '.join(["sudo", "losetup",
-                                    Runner.LOOPDEV, self.disk_path]), 
+            return (False, None)
+        if self.MEM_DISK_ALLOC == "fallocate":
+            cmd = "fallocate -l %s %s"
+        else:
+            cmd = "truncate -s %s %s"
+        p = self.exec_cmd(cmd % (self.DISK_SIZE, self.disk_path),
                           self.dev_null)
-        if p.returncode == 0:
-            self.umount_hook.append(self.deinit_mem_disk)
-        return (p.returncode == 0, Runner.LOOPDEV)
+        if p.returncode != 0:
+            self.umount(self.tmp_path)
+            return (False, None)
+        try:
+            self.mem_loopdev = self.priv.losetup_attach(self.disk_path,
+                                                        self.LOOP_BLOCK_SIZE,
+                                                        self.LOOP_DIRECT_IO)
+        except PrivHelperError as e:
+            self.priv_error(e)
+            self.umount(self.tmp_path)
+            return (False, None)
+        return (True, self.mem_loopdev)
 
     def deinit_mem_disk(self):
-        self.unset_loopdev()
+        if self.mem_loopdev:
+            try:
+                self.priv.losetup_detach(self.mem_loopdev)
+            except PrivHelperError as e:
+                self.priv_error(e)
+            self.mem_loopdev = None
         self.umount(self.tmp_path)
 
+    def load_module(self, name, params):
+        # a module is loaded once with our parameters
+        # and kept until unload_modules()
+        if name in self.loaded_modules:
+            return True
+        try:
+            self.priv.unload_module(name)
+        except PrivHelperError:
+            pass
+        try:
+            self.priv.load_module(name, params)
+        except PrivHelperError as e:
+            self.priv_error(e)
+            return False
+        self.loaded_modules.append(name)
+        return True
+
+    def unload_modules(self):
+        for name in self.loaded_modules:
+            try:
+                self.priv.unload_module(name)
+            except PrivHelperError as e:
+                self.priv_error(e)
+        self.loaded_modules = []
+
+    def init_brd_disk(self):
+        rc = self.load_module("brd",
+                              ["rd_nr=%d" % self.BRD_COUNT,
+                               "rd_size=%d" % (size_to_bytes(self.BRD_SIZE) // 1024)])
+        return (rc and os.path.exists(Runner.BRDDEV), Runner.BRDDEV)
+
+    def init_nullb_disk(self):
+        nsec = self.NULLB_COMPLETION_NSEC
+        rc = self.load_module("null_blk",
+                              ["nr_devices=1",
+                               "memory_backed=1",
+                               "gb=%d" % max(1, size_to_bytes(self.NULLB_SIZE) // 2**30),
+                               "queue_mode=%d" % self.NULLB_QUEUE_MODE,
+                               "irqmode=%d" % (2 if nsec else 0), # 2: timer
+                               "completion_nsec=%d" % nsec])
+        return (rc and os.path.exists(Runner.NULLBDEV), Runner.NULLBDEV)
+
     def init_nvme_disk(self):
         return (os.path.exists(Runner.NVMEDEV), Runner.NVMEDEV)
 
@@ -315,31 +553,135 @@ class Runner(object):
         return (rc, dev_path)
 
     def mount_tmpfs(self, media, fs, mnt_path):
-        p = self.exec_cmd("sudo mount -t tmpfs -o mode=0777,size="
-                          + self.DISK_SIZE + " none " + mnt_path,
+        try:
+            self.priv.mount("none", mnt_path, "tmpfs",
+                            "mode=0777,size=" + self.DISK_SIZE)
+        except PrivHelperError as e:
+            self.priv_error(e)
+            return False
+        return True
+
+    def mkfs_anyfs(self, fs, dev_path):
+        try:
+            self.priv.mkfs(fs, self.HOWTO_MKFS.get(fs, "").split(), dev_path)
+        except PrivHelperError as e:
+            self.priv_error(e)
+            return False
+        return True
+
+    def mkfs_ext4_no_jnl(self, fs, dev_path):
+        try:
+            self.priv.mkfs("ext4", self.HOWTO_MKFS.get(fs, "").split(),
+                           dev_path)
+            self.priv.ext4_remove_journal(dev_path)
+        except PrivHelperError as e:
+            self.priv_error(e)
+            return False
+        return True
+
+    def get_dev_geometry(self, dev_path):
+        try:
+            return self.priv.dev_geometry(dev_path)
+        except PrivHelperError as e:
+            self.priv_error(e)
+            return (0, 0)
+
+    def get_mkfs_version(self, fs):
+        # e.g., 'mke2fs 1.47.0 (5-Feb-2023)'
+        tool = "mkfs.%s" % {"ext4_no_jnl":"ext4"}.get(fs, fs)
+        if tool not in self.mkfs_version:
+            try:
+                p = subprocess.Popen([tool, "-V"], stdout=subprocess.PIPE,
+                                     stderr=subprocess.STDOUT)
+                out = p.communicate()[0].decode("utf-8", "replace").strip()
+            except OSError:
+                out = ""
+            self.mkfs_version[tool] = out.splitlines()[0] if out else ""
+        return self.mkfs_version[tool]
+
+    def get_mkfs_cache_img(self, fs, dev_size, sect_size):
+        # an image is valid only for the exact same mkfs version,
+        # command line, and device geometry
+        key = '|'.join([fs, self.HOWTO_MKFS.get(fs, ""),
+                        self.get_mkfs_version(fs),
+                        str(dev_size), str(sect_size)])
+        digest = hashlib.sha1(key.encode("utf-8")).hexdigest()[:16]
+        return os.path.join(self.mkfs_cache_path,
+                            "%s-%s-%s.img" % (fs, dev_size, digest))
+
+    def build_mkfs_cache(self, fs, mkfs_fn, img, dev_size, sect_size):
+        # mkfs on a sparse file of the same size through a loop device
+        # with the same sector size. Holes in the resulting image are
+        # the blocks that mkfs never wrote (or discarded).
+        self.exec_cmd("mkdir -p " + self.mkfs_cache_path, self.dev_null)
+        tmp_img = img + ".tmp"
+        self.exec_cmd("rm -f " + tmp_img, self.dev_null)
+        p = self.exec_cmd("truncate -s %s %s" % (dev_size, tmp_img),
                           self.dev_null)
-        return p.returncode == 0
+        if p.returncode != 0:
+            return False
+        try:
+            loop_dev = self.priv.losetup_attach(tmp_img, sect_size)
+        except PrivHelperError as e:
+            self.priv_error(e)
+            self.exec_cmd("rm -f " + tmp_img, self.dev_null)
+            return False
+        rc = mkfs_fn(fs, loop_dev)
+        try:
+            self.priv.losetup_detach(loop_dev)
+        except PrivHelperError as e:
+            self.priv_error(e)
+        if not rc:
+            self.exec_cmd("rm -f " + tmp_img, self.dev_null)
+            return False
+        os.rename(tmp_img, img)
+        return True
+
+    def restore_mkfs_cache(self, img, dev_path):
+        # discard the whole device as mkfs does by default
+        # (it may fail, e.g., on hdd), then write back the blocks that
+        # mkfs wrote and zero the rest so nothing stale is left.
+        # restore-fsimg fails without writing if the device cannot
+        # zero cheaply (see bin/restore-fsimg), and mkfs runs instead.
+        try:
+            self.priv.discard(dev_path)
+        except PrivHelperError:
+            pass
+        try:
+            self.priv.restore_fsimg(img, dev_path)
+        except PrivHelperError as e:
+            self.priv_error(e)
+            return False
+        return True
+
+    def format(self, fs, dev_path, mkfs_fn):
+        if not self.MKFS_CACHE:
+            return mkfs_fn(fs, dev_path)
+        (dev_size, sect_size) = self.get_dev_geometry(dev_path)
+        if not dev_size:
+            return mkfs_fn(fs, dev_path)
+        img = self.get_mkfs_cache_img(fs, dev_size, sect_size)
+        if not os.path.exists(img) and \
+           not self.build_mkfs_cache(fs, mkfs_fn, img, dev_size, sect_size):
+            return mkfs_fn(fs, dev_path)
+        if not self.restore_mkfs_cache(img, dev_path):
+            return mkfs_fn(fs, dev_path)
+        return True
 
     def mount_anyfs(self, media, fs, mnt_path):
         (rc, dev_path) = self.init_media(media)
         if not rc:
             return False
 
-        p = self.exec_cmd("sudo mkfs." + fs
-                          + " " + self.HOWTO_MKFS.get(fs, "")
-                          + " " + dev_path,
-                          self.dev_null)
-        if p.returncode is not 0:
+        if not self.format(fs, dev_path, self.mkfs_anyfs):
             return False
-        p = self.exec_cmd(' '.join(["sudo mount -t", fs,
-                                    dev_path, mnt_path]),
-                          self.dev_null)
-        if p.returncode is not 0:
-            return False
-        p = self.exec_cmd("sudo chmod 777 " + mnt_path,
-                          self.dev_null)
-        if p.returncode is not 0:
+        try:
+            self.priv.mount(dev_path, mnt_path, fs)
+            self.priv.chmod(mnt_path, 0o777)
+        except PrivHelperError as e:
+            self.priv_error(e)
             return False
+        self.test_dev = dev_path
         return True
 
     def mount_ext4_no_jnl(self, media, fs, mnt_path):
@@ -347,25 +689,15 @@ class Runner(object):
         if not rc:
             return False
 
-        p = self.exec_cmd("sudo mkfs.ext4"
-                          + " " + self.HOWTO_MKFS.get(fs, "")
-                          + " " + dev_path,
-                          self.dev_null)
-        if p.returncode is not 0:
-            return False
-        p = self.exec_cmd("sudo tune2fs -O ^has_journal %s" % dev_path,
-                          self.dev_null)
-        if p.returncode is not 0:
+        if not self.format(fs, dev_path, self.mkfs_ext4_no_jnl):
             return False
-        p = self.exec_cmd(' '.join(["sudo mount -t ext4",
-                                    dev_path, mnt_path]),
-                          self.dev_null)
-        if p.returncode is not 0:
-            return False
-        p = self.exec_cmd("sudo chmod 777 " + mnt_path,
-                          self.dev_null)
-        if p.returncode is not 0:
+        try:
+            self.priv.mount(dev_path, mnt_path, "ext4")
+            self.priv.chmod(mnt_path, 0o777)
+        except PrivHelperError as e:
+            self.priv_error(e)
             return False
+        self.test_dev = dev_path
         return True
 
     def mount(self, media, fs, mnt_path):
@@ -374,9 +706,34 @@ class Runner(object):
             return False;
 
         self.umount(mnt_path)
+        self.test_dev = None
         self.exec_cmd("mkdir -p " + mnt_path, self.dev_null)
         return mount_fn(media, fs, mnt_path)
 
+    def wipe_test_root(self):
+        # delete top-level entries of the test root in parallel
+        # but keep lost+found as a fresh file system does.
+        try:
+            self.priv.wipe(self.test_root, self.nhwthr, ["lost+found"])
+        except PrivHelperError as e:
+            self.priv_error(e)
+            return False
+        return True
+
+    def prepare_fs(self, media, fs, dio):
+        mount_group = (media, fs, dio)
+        self.mount_reused = False
+        if self.MOUNT_REUSE and self.mount_group == mount_group:
+            if self.wipe_test_root():
+                self.mount_reused = True
+                return True
+        self.mount_group = None
+        if not self.mount(media, fs, self.test_root):
+            return False
+        if self.MOUNT_REUSE:
+            self.mount_group = mount_group
+        return True
+
     def _match_config(self, key1, key2):
         for (k1, k2) in zip(key1, key2):
             if k1 == "*" or k2 == "*":
@@ -385,7 +742,7 @@ class Runner(object):
                 return False
         return True
 
-    def gen_config(self):
+    def _gen_config(self):
         for ncore in sorted(self.ncores, reverse=True):
             for bench in self.BENCH_TYPES:
                 for media in self.MEDIA_TYPES:
@@ -396,14 +753,38 @@ class Runner(object):
                             mount_fn = self.HOWTO_MOUNT.get(fs, None)
                             if not mount_fn:
                                 continue
+                            if (media, fs, bench, ncore, dio) in self.SKIP_CONFIG:
+                                continue
                             if self._match_config(self.FILTER, \
                                                   (media, fs, bench, str(ncore), dio)):
                                 yield(media, fs, bench, ncore, dio)
 
+    def _mount_group_order(self, config):
+        (media, fs, bench, ncore, dio) = config
+        return (self.MEDIA_TYPES.index(media),
+                self.FS_TYPES.index(fs),
+                self.DIRECTIOS.index(dio),
+                -ncore,
+                self.BENCH_TYPES.index(bench))
+
+    def gen_config(self):
+        if not self.MOUNT_REUSE:
+            return self._gen_config()
+        # group configs by (media, fs, directio) so that a mounted
+        # file system can be reused by all configs in a group
+        return iter(sorted(self._gen_config(), key=self._mount_group_order))
+
     def fxmark_env(self):
-        env = ' '.join(["PERFMON_LEVEL=%s" % self.PERFMON_LEVEL,
+        env = ' '.join([self.priv.env(),
+                        "PERFMON_LEVEL=%s" % self.PERFMON_LEVEL,
                         "PERFMON_LDIR=%s"  % self.log_dir,
-                        "PERFMON_LFILE=%s" % self.perfmon_log])
+                        "PERFMON_LFILE=%s" % self.perfmon_log,
+                        "PERFMON_TELEMETRY_MSECS=%s" % self.TELEMETRY_MSECS])
+        if self.test_dev:
+            env += " PERFMON_DEV=%s" % self.test_dev
+        if self.CPU_RESTRICT == "cpuset" and self.active_ncore > 0:
+            env += " PERFMON_CPUS=%s" % ','.join(
+                map(lambda c: str(c), cpupol.seq_cores[0:self.active_ncore]))
         return env
 
     def get_bin_type(self, bench):
@@ -413,10 +794,11 @@ class Runner(object):
             return (self.dbench_path, bench[len("dbench_"):])
         return (self.fxmark_path, bench)
 
-    def fxmark(self, media, fs, bench, ncore, nfg, nbg, dio):
+    def fxmark(self, media, fs, bench, ncore, nfg, nbg, dio, rep=0):
         self.perfmon_log = os.path.normpath(
             os.path.join(self.log_dir,
-                         '.'.join([media, fs, bench, str(nfg), "pm"])))
+                         '.'.join([media, fs, bench, str(nfg), dio,
+                                   str(rep), "pm"])))
         (bin, type) = self.get_bin_type(bench)
         directio = '1' if dio is "directio" else '0'
 
@@ -438,23 +820,97 @@ class Runner(object):
                         "--profbegin", "\"%s\"" % self.perfmon_start,
                         "--profend",   "\"%s\"" % self.perfmon_stop,
                         "--proflog", self.perfmon_log])
-        p = self.exec_cmd(cmd, self.redirect)
-        if self.redirect:
-            for l in p.stdout.readlines():
-                self.log(l.decode("utf-8").strip())
+        if bin == self.fxmark_path and self.WARMUP:
+            cmd = ' '.join([cmd, "--warmup", str(self.WARMUP)])
+        if bin == self.fxmark_path and self.CONVERGE:
+            cmd = ' '.join([cmd,
+                            "--converge", str(self.CONVERGE),
+                            "--minduration", str(self.MIN_DURATION)])
+        if bin == self.fxmark_path and self.LATENCY:
+            cmd = ' '.join([cmd, "--latency", "1"])
+        if bin == self.fxmark_path and self.SAMPLE_MSECS:
+            ts_log = os.path.normpath(
+                os.path.join(self.log_dir,
+                             '.'.join([media, fs, bench, str(nfg), dio,
+                                       str(rep), "ts"])))
+            cmd = ' '.join([cmd,
+                            "--interval", str(self.SAMPLE_MSECS),
+                            "--tslog", ts_log])
+        preexec_fn = self.enter_cpuset if self.CPU_RESTRICT == "cpuset" else None
+        t_start = time.time()
+        deadline = self.get_deadline(bench)
+        (out, self.bench_timed_out) = self.exec_bench(cmd, deadline, preexec_fn)
+        if self.bench_timed_out:
+            return self.fxmark_timeout(time.time() - t_start, deadline)
+        result = []
+        if out:
+            for l in out.decode("utf-8").splitlines():
+                result.append(l.strip())
+                self.log(result[-1])
+        return result
+
+    def fxmark_timeout(self, elapsed, deadline):
+        result = ["# status elapsed.secs deadline.secs",
+                  "TIMEOUT %.1f %s" % (elapsed, deadline)]
+        for l in result:
+            self.log(l)
+        # the fs may be wedged so do not reuse it for the next config
+        self.perfmon_cleanup()
+        self.umount(self.test_root, force=True)
+        self.mount_group = None
+        return result
+
+    def perfmon_cleanup(self):
+        # stop the perfmon session of the current config and remove its
+        # partial outputs; outputs of finished configs are left alone
+        self.exec_cmd(' '.join([self.fxmark_env(), self.perfmon_stop]))
+        for f in glob.glob(glob.escape(self.perfmon_log) + "*"):
+            try:
+                os.remove(f)
+            except OSError:
+                pass
+        self.reset_lock_stat()
 
     def fxmark_cleanup(self):
         cmd = ' '.join([self.fxmark_env(),
                         "%s; rm -f %s/*.pm" % (self.perfmon_stop, self.log_dir)])
         self.exec_cmd(cmd)
-        self.exec_cmd("sudo sh -c \"echo 0 >/proc/sys/kernel/lock_stat\"",
-                      self.dev_null)
+        self.reset_lock_stat()
+
+    def run_one(self, media, fs, bench, ncore, nfg, nbg, dio, rep=0):
+        t_setup = time.time()
+        self.prepre_work(ncore)
+        if not self.prepare_fs(media, fs, dio):
+            self.log("# Fail to mount %s on %s." % (fs, media))
+            return None
+        self.log("## %s:%s:%s:%s:%s" % (media, fs, bench, nfg, dio))
+        self.pre_work()
+        t_bench = time.time()
+        result = self.fxmark(media, fs, bench, ncore, nfg, nbg, dio, rep)
+        t_end = time.time()
+        self.post_work()
+
+        # remember setup costs for Planner
+        if self.bench_timed_out:
+            return result
+        self.setup_cost.put("wipe" if self.mount_reused else "mount",
+                            "%s:%s" % (media, fs), t_bench - t_setup)
+        # get_bench_secs() includes the warm-up of fxmark
+        self.setup_cost.put("bench", bench,
+                            t_end - t_bench - self.get_bench_secs(bench))
+        self.setup_cost.save()
+        return result
 
     def run(self):
+        self.priv.start()
         try:
             cnt = -1
             self.log_start()
-            for (cnt, (media, fs, bench, ncore, dio)) in enumerate(self.gen_config()):
+            for (cnt, config) in enumerate(self.gen_config()):
+                (media, fs, bench, ncore, dio) = config
+                ndone = self.journal.done.get(config, 0)
+                if ndone >= self.REPETITIONS:
+                    continue
                 (ncore, nbg) = self.add_bg_worker_if_needed(bench, ncore)
                 nfg = ncore - nbg
 
@@ -462,34 +918,36 @@ class Runner(object):
                     self.log("## %s:%s:%s:%s:%s" % (media, fs, bench, nfg, dio))
                     continue
 
-                self.prepre_work(ncore)
-                if not self.mount(media, fs, self.test_root):
-                    self.log("# Fail to mount %s on %s." % (fs, media))
-                    continue
-                self.log("## %s:%s:%s:%s:%s" % (media, fs, bench, nfg, dio))
-                self.pre_work()
-                self.fxmark(media, fs, bench, ncore, nfg, nbg, dio)
-                self.post_work()
+                for rep in range(ndone, self.REPETITIONS):
+                    result = self.run_one(media, fs, bench, ncore, nfg, nbg, dio, rep)
+                    if result is None:
+                        break
+                    # a timed-out repetition is not done; --resume retries it
+                    if not self.bench_timed_out:
+                        self.journal.append(config, rep, result)
             self.log("### NUM_TEST_CONF  = %d" % (cnt + 1))
         finally:
             signal.signal(signal.SIGINT, catch_ctrl_C)
             self.log_end()
             self.fxmark_cleanup()
             self.umount(self.test_root)
+            self.deinit_mem_disk()
+            self.unload_modules()
             self.set_cpus(0)
+            self.priv.stop()
 
 def confirm_media_path():
     print("%" * 80)
     print("%% WARNING! WARNING! WARNING! WARNING! WARNING!")
     print("%" * 80)
-    yn = input("All data in %s, %s, %s and %s will be deleted. Is it ok? [Y,N]: "
-            % (Runner.HDDDEV, Runner.SSDDEV, Runner.NVMEDEV, Runner.LOOPDEV))
+    yn = input("All data in %s, %s and %s will be deleted. Is it ok? [Y,N]: "
+            % (Runner.HDDDEV, Runner.SSDDEV, Runner.NVMEDEV))
     if yn != "Y":
-        print("Please, check Runner.LOOPDEV and Runner.NVMEDEV")
+        print("Please, check Runner.HDDDEV, Runner.SSDDEV and Runner.NVMEDEV")
         exit(1)
     yn = input("Are you sure? [Y,N]: ")
     if yn != "Y":
-        print("Please, check Runner.LOOPDEV and Runner.NVMEDEV")
+        print("Please, check Runner.HDDDEV, Runner.SSDDEV and Runner.NVMEDEV")
         exit(1)
     print("%" * 80)
     print("\n\n")
@@ -509,11 +967,19 @@ if __name__ == "__main__":
     # - PerfMon.LEVEL_PERF_PROBE_SLEEP_LOCK_D  # do NOT use if you don't understand what it is
     # - PerfMon.LEVEL_PERF_LOCK                # do NOT use if you don't understand what it is
     # - PerfMon.LEVEL_PERF_STAT                # for cycles and instructions
+    # - PerfMon.LEVEL_PERF_OFFCPU              # for blocked time per sleepable lock
+    # - PerfMon.LEVEL_SYSCALL_HIST             # for syscall latency percentiles
     #
     # o testcase filter
     # - (storage device, filesystem, test case, # core, directio | bufferedio)
-
-    # TODO: make it scriptable
+    #
+    # o run_config below is used unless a campaign file is given
+    #   (see campaign.py for the file format)
+    # - run-fxmark.py --campaign {campaign file} [--plan]
+    #
+    # o an interrupted run can be resumed with the same run_config or
+    #   campaign file; finished configs in the journal are skipped
+    # - run-fxmark.py [--campaign {campaign file}] --resume {log dir}
     run_config = [
         (Runner.CORE_FINE_GRAIN,
          PerfMon.LEVEL_LOW,
@@ -528,7 +994,41 @@ if __name__ == "__main__":
         #  ("*", "*", "*", str(cpupol.PHYSICAL_CHIPS * cpupol.CORE_PER_CHIP), "*"))
     ]
 
+    parser = optparse.OptionParser()
+    parser.add_option("--campaign", help="campaign file (JSON or TOML)")
+    parser.add_option("--plan", action="store_true", default=False,
+                      help="print configs and estimated time, then exit")
+    parser.add_option("--resume", metavar="LOGDIR",
+                      help="resume an interrupted run logged at LOGDIR")
+    (opts, args) = parser.parse_args()
+
+    if opts.campaign:
+        runners = list(Campaign(opts.campaign).gen_runners(Runner))
+    else:
+        runners = [Runner(c[0], c[1], c[2]) for c in run_config]
+    dups = Campaign.remove_duplicates(runners)
+    for (i, runner) in enumerate(runners):
+        runner.RUN_INDEX = i
+
+    if opts.resume:
+        journal = Journal(opts.resume)
+        if not journal.load():
+            print("# ERROR: no journal at %s" % opts.resume)
+            exit(1)
+        if journal.header["machine"] != get_machine_id():
+            print("# ERROR: %s was run on a different machine" % opts.resume)
+            print("# %s" % journal.header["machine"])
+            exit(1)
+        # runners before the interrupted one had finished
+        runners = runners[journal.header["run"]:]
+        if runners:
+            runners[0].RESUME_DIR = opts.resume
+
+    if opts.plan:
+        setup_cost = SetupCost(os.path.join(CUR_DIR, ".setup-cost.json"))
+        Planner(setup_cost).print_plan(runners, dups)
+        exit(0)
+
     confirm_media_path()
-    for c in run_config:
-        runner = Runner(c[0], c[1], c[2])
+    for runner in runners:
         runner.run()
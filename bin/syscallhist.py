@@ -0,0 +1,93 @@
+#!/usr/bin/env python3
+
+import re
+
+''' Syscall latency histograms of PerfMon.LEVEL_SYSCALL_HIST runs
+
+    - tracefs hist triggers on raw_syscalls:sys_enter/sys_exit feed a
+      synthetic event whose log2 histogram of latency per syscall is
+      kept in the kernel, so nothing is copied to user space per event.
+    - A percentile is the upper bound of its log2 bucket.
+
+    # HOWTO
+    - https://www.kernel.org/doc/html/latest/trace/histogram.html
+'''
+
+SYNTH_NAME = "fxmark_sys_lat"
+SYNTH_EVENT = "%s u64 lat; long id" % SYNTH_NAME
+
+# (tracefs file, trigger) in the order of attaching
+TRIGGERS = [
+    ("events/raw_syscalls/sys_enter/trigger",
+     "hist:keys=common_pid:ts0=common_timestamp.usecs"),
+    ("events/raw_syscalls/sys_exit/trigger",
+     "hist:keys=common_pid:lat=common_timestamp.usecs-$ts0:"
+     "onmatch(raw_syscalls.sys_enter).%s($lat,id)" % SYNTH_NAME),
+    ("events/synthetic/%s/trigger" % SYNTH_NAME,
+     "hist:keys=id.syscall,lat.log2:sort=id,lat:size=8192"),
+]
+HIST = "events/synthetic/%s/hist" % SYNTH_NAME
+
+PERCENTILES = [("p50", 0.5), ("p99", 0.99), ("p999", 0.999)]
+
+# { id: sys_write                     [  1], lat: ~ 2^5   } hitcount:   10
+ENTRY = re.compile(r"id:\s*(\S+)\s*\[\s*\d+\]\s*,\s*lat:\s*~\s*2\^(\d+)"
+                   r"\s*}\s*hitcount:\s*(\d+)")
+DROPPED = re.compile(r"Dropped:\s*(\d+)")
+
+def comm_filter(comms):
+    return " if " + " || ".join("comm == \"%s\"" % c for c in comms)
+
+def parse_hist(text):
+    # returns ({syscall:{log2 bucket:count}}, # dropped)
+    (hist, dropped) = ({}, 0)
+    for l in text.splitlines():
+        m = ENTRY.search(l)
+        if m:
+            buckets = hist.setdefault(m.group(1), {})
+            b = int(m.group(2))
+            buckets[b] = buckets.get(b, 0) + int(m.group(3))
+            continue
+        m = DROPPED.search(l)
+        if m:
+            dropped += int(m.group(1))
+    return (hist, dropped)
+
+def percentiles(buckets):
+    total = sum(buckets.values())
+    (vals, seen) = ({}, 0)
+    for b in sorted(buckets):
+        seen += buckets[b]
+        for (name, p) in PERCENTILES:
+            if name not in vals and seen >= p * total:
+                vals[name] = 2 ** (b + 1)
+    vals["max"] = 2 ** (max(buckets) + 1)
+    vals["count"] = total
+    return vals
+
+def write_table(hist, path):
+    # one line per syscall, the most frequent first
+    with open(path, "w") as fd:
+        print("# syscall count %s" %
+              " ".join("%s.usecs" % n for n in [p[0] for p in PERCENTILES] +
+                       ["max"]), file=fd)
+        for (sc, buckets) in sorted(hist.items(),
+                                    key=lambda kv: -sum(kv[1].values())):
+            vals = percentiles(buckets)
+            print("%s %d %s" % (sc, vals["count"], " ".join(
+                "%d" % vals[n] for n in [p[0] for p in PERCENTILES] +
+                ["max"])), file=fd)
+
+def result_columns(hist, dropped):
+    # [(name, value)] of all syscalls to be appended to a result line
+    merged = {}
+    for buckets in hist.values():
+        for (b, c) in buckets.items():
+            merged[b] = merged.get(b, 0) + c
+    if not merged:
+        return []
+    vals = percentiles(merged)
+    return [("syscall.count", vals["count"])] + \
+           [("syscall.%s.usecs" % n, vals[n])
+            for n in [p[0] for p in PERCENTILES]] + \
+           [("syscall.dropped", dropped)]
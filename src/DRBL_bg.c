@@ -54,7 +54,7 @@ static int fg_work(struct worker *worker)
 	uint64_t iter = 0;
 
 	fd = (int)worker->private[0];
-	for (iter = 0; !bench->stop; ++iter) {
+	for (iter = 0; bench_running(worker, iter); ++iter) {
 	        if (pread(fd, page, sizeof(page), 0) == -1)
 			goto err_out;
 	}
@@ -76,7 +76,7 @@ static int bg_work(struct worker *worker)
 	uint64_t iter = 0;
 
 	fd = (int)worker->private[0];
-	for (iter = 0; !bench->stop; ++iter) {
+	for (iter = 0; bench_running(worker, iter); ++iter) {
 	        if (pwrite(fd, page, sizeof(page), 0) == -1)
 			goto err_out;
 	}
@@ -118,7 +118,7 @@ static int main_work(struct worker *worker)
                 goto err_out;
 
         pos = PRIVATE_REGION_SIZE * worker->id;
-        for (iter = 0; !bench->stop; ++iter) {
+        for (iter = 0; bench_running(worker, iter); ++iter) {
                 if (pwrite(fd, page, PAGE_SIZE, pos) != PAGE_SIZE)
                         goto err_out;
         }
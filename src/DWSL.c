@@ -75,7 +75,7 @@ static int main_work(struct worker *worker)
 
 	/* fsync */
 	fd = (int)worker->private[0];
-	for (iter = 0; !bench->stop; ++iter) {
+	for (iter = 0; bench_running(worker, iter); ++iter) {
 	        if (pwrite(fd, page, PAGE_SIZE, 0) != PAGE_SIZE)
 			goto err_out;
 		if (fsync(fd) == -1)
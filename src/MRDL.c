@@ -85,7 +85,7 @@ static int main_work(struct worker *worker)
 	while (!bench->stop) {
 		dir = opendir(dir_path);
 		if (!dir) goto err_out;
-		for (; !bench->stop; ++iter) {
+		for (; bench_running(worker, iter); ++iter) {
 			rc = readdir_r(dir, &entry, &result);
 			if (rc) goto err_out;
 		}
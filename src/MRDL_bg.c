@@ -88,7 +88,7 @@ static int fg_work(struct worker *worker)
 	while (!bench->stop) {
 		dir = opendir(dir_path);
 		if (!dir) goto err_out;
-		for (; !bench->stop; ++iter) {
+		for (; bench_running(worker, iter); ++iter) {
 			rc = readdir_r(dir, &entry, &result);
 			if (rc) goto err_out;
 		}
@@ -113,7 +113,7 @@ static int bg_work(struct worker *worker)
 
 	while (!bench->stop) {
 		/* delete a randomly selected file in each worker's private directory */
-		for (i = 0; i < bench->ncpu && !bench->stop; ++i) {
+		for (i = 0; i < bench->ncpu && bench_running(worker, iter); ++i) {
 			struct worker *w = &bench->workers[i];
 			if (w->is_bg) continue;
 
@@ -125,7 +125,7 @@ static int bg_work(struct worker *worker)
 		}
 
 		/* create the deleted file of each worker */
-		for (i = 0; i < bench->ncpu && !bench->stop; ++i) {
+		for (i = 0; i < bench->ncpu && bench_running(worker, iter); ++i) {
 			struct worker *w = &bench->workers[i];
 			if (w->is_bg) continue;
 			
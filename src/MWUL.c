@@ -69,7 +69,7 @@ static int main_work(struct worker *worker)
     uint64_t iter;
     int rc = 0;
 
-    for (iter = 0; iter < worker->private[0] && !bench->stop; ++iter) {
+    for (iter = 0; iter < worker->private[0] && bench_running(worker, iter); ++iter) {
         char file[PATH_MAX];
         set_test_file(worker, iter, file);
         if (unlink(file))
@@ -1,5 +1,7 @@
 // SPDX-License-Identifier: MIT
 #include <sys/time.h>
+#include <sys/wait.h>
+#include <sys/resource.h>
 #include <sched.h>
 #include <sys/mman.h>
 #include <unistd.h>
@@ -8,11 +10,16 @@
 #include <string.h>
 #include <stdio.h>
 #include <stdlib.h>
+#include <math.h>
 
 #include "bench.h"
 #include "cpupol.h"
 #include "rdtsc.h"
 
+/* sampler configuration */
+#define SAMPLE_MSECS_DEFAULT 100
+#define CONVERGE_WINDOW 20	/* # of recent samples to check convergence */
+
 static struct bench *running_bench;
 
 static uint64_t usec(void)
@@ -75,6 +82,77 @@ static void sighandler(int x)
         running_bench->stop = 1;
 }
 
+static uint64_t timeval_us(struct timeval *tv)
+{
+	return (uint64_t)tv->tv_sec * 1000000 + tv->tv_usec;
+}
+
+static void get_worker_rusage(struct worker_rusage *ru)
+{
+	struct rusage r;
+	unsigned long long v, run, wait;
+	char line[256];
+	FILE *fp;
+
+	memset(ru, 0, sizeof(*ru));
+	if (!getrusage(RUSAGE_SELF, &r)) {
+		ru->utime_us = timeval_us(&r.ru_utime);
+		ru->stime_us = timeval_us(&r.ru_stime);
+		ru->nvcsw    = r.ru_nvcsw;
+		ru->nivcsw   = r.ru_nivcsw;
+		ru->minflt   = r.ru_minflt;
+		ru->majflt   = r.ru_majflt;
+	}
+
+	/* migrations from /proc/self/sched (CONFIG_SCHED_DEBUG) */
+	fp = fopen("/proc/self/sched", "r");
+	if (fp) {
+		while (fgets(line, sizeof(line), fp)) {
+			if (sscanf(line, "se.nr_migrations : %llu", &v) == 1)
+				ru->migrations = v;
+		}
+		fclose(fp);
+	}
+
+	/* run time and runqueue wait time in nsec (CONFIG_SCHED_INFO) */
+	fp = fopen("/proc/self/schedstat", "r");
+	if (fp) {
+		if (fscanf(fp, "%llu %llu", &run, &wait) == 2)
+			ru->runq_us = wait / 1000;
+		fclose(fp);
+	}
+}
+
+static void sub_worker_rusage(struct worker_rusage *ru,
+			      struct worker_rusage *start)
+{
+	uint64_t *v = (uint64_t *)ru, *s = (uint64_t *)start;
+	int i;
+
+	for (i = 0; i < sizeof(*ru) / sizeof(uint64_t); ++i)
+		v[i] -= s[i];
+}
+
+void worker_end_warmup(struct worker *worker, uint64_t works)
+{
+	/* the snapshot itself is not charged to the measured window */
+	get_worker_rusage(&worker->ru_start);
+
+	/* measure for the full duration from here, however late the
+	 * end of warm-up was seen (e.g., a slow profiler start) */
+	if (!worker->id)
+		alarm(worker->bench->duration);
+
+	/* measurement starts from here; the operation in flight, which
+	 * includes the snapshot, is not a latency sample */
+	worker->warm_works = works;
+	worker->lat_prev = 0;
+	worker->lat_max = 0;
+	memset(worker->lat_hist, 0, sizeof(worker->lat_hist));
+	worker->warm_clk = rdtsc_beg();
+	worker->warm_us = usec();
+}
+
 #pragma GCC diagnostic push
 #pragma GCC diagnostic ignored "-Wunused-result"
 
@@ -112,8 +190,9 @@ static void worker_main(void *arg)
 		/* make things more deterministic */
 		sync();
 
-		/* start performance profiling */
-		if (bench->profile_start_cmd[0])
+		/* start performance profiling
+		 * (with warm-up, the sampler starts it at the end of warm-up) */
+		if (!bench->warmup && bench->profile_start_cmd[0])
 			system(bench->profile_start_cmd);
 
                 /* ok, before running, set timer */
@@ -122,12 +201,13 @@ static void worker_main(void *arg)
                         goto err_out;
                 }
                 running_bench = bench;
-                alarm(bench->duration);
+                alarm(bench->warmup + bench->duration);
                 bench->start = 1;
                 wmb();
         }
         
         /* start time */
+        get_worker_rusage(&worker->ru_start);
         s_clk = rdtsc_beg();
         s_us = usec();
 
@@ -141,6 +221,16 @@ static void worker_main(void *arg)
         /* end time */ 
         e_clk = rdtsc_end();
         e_us = usec();
+        get_worker_rusage(&worker->ru);
+        sub_worker_rusage(&worker->ru, &worker->ru_start);
+
+	/* exclude warm-up; a worker that never saw the end of warm-up
+	 * (e.g., it finished its works earlier) reports its whole run */
+	if (bench->warmup && worker->warm_us) {
+		s_clk = worker->warm_clk;
+		s_us = worker->warm_us;
+		worker->works -= worker->warm_works;
+	}
 
 	/* stop performance profiling */
         if (!worker->id && bench->profile_stop_cmd[0])
@@ -156,7 +246,143 @@ err_out:
         worker->clocks = e_clk - s_clk;
 }
 
-static void wait(struct bench *bench)
+static double sum_live_works(struct bench *bench)
+{
+	double works = 0.0;
+	int i;
+
+	for (i = 0; i < bench->ncpu; ++i) {
+		struct worker *w = &bench->workers[i];
+		if (w->is_bg) continue;
+		works += w->live_works;
+	}
+	return works;
+}
+
+static int is_converged(double *tput, int n, double converge)
+{
+	double mean = 0.0, var = 0.0;
+	int i;
+
+	for (i = 0; i < n; ++i)
+		mean += tput[i];
+	mean /= n;
+	if (mean <= 0.0)
+		return 0;
+	for (i = 0; i < n; ++i)
+		var += (tput[i] - mean) * (tput[i] - mean);
+	var /= (n - 1);
+
+	/* 1.96 * sqrt(var / n) / mean <= converge */
+	return (1.96 * 1.96 * var / n) <= (converge * converge * mean * mean);
+}
+
+static void print_ts_header(struct bench *bench, FILE *ts)
+{
+	int i;
+
+	fprintf(ts, "# usecs works");
+	for (i = 0; i < bench->ncpu; ++i) {
+		struct worker *w = &bench->workers[i];
+		fprintf(ts, " %s%d", w->is_bg ? "bg" : "w", w->id);
+	}
+	fprintf(ts, "\n");
+}
+
+static void print_ts(struct bench *bench, FILE *ts, uint64_t usecs,
+		     double works, uint64_t *live_works)
+{
+	int i;
+
+	fprintf(ts, "%lu %.0f", usecs, works);
+	for (i = 0; i < bench->ncpu; ++i) {
+		uint64_t cur = bench->workers[i].live_works;
+		fprintf(ts, " %lu", cur - live_works[i]);
+		live_works[i] = cur;
+	}
+	fprintf(ts, "\n");
+}
+
+static void sampler_main(struct bench *bench)
+{
+	double tput[CONVERGE_WINDOW];
+	double works, prev_works;
+	uint64_t s_us, now_us, prev_us, warm_us = 0;
+	uint64_t live_works[bench->ncpu];
+	FILE *ts = NULL;
+	int i, n;
+
+	if (bench->ts_file[0]) {
+		ts = fopen(bench->ts_file, "w");
+		if (ts)
+			print_ts_header(bench, ts);
+	}
+
+	/* workers may fail before the start (e.g., in pre_work) */
+	while (!bench->start && !bench->stop)
+		usleep(1000);
+	if (!bench->start)
+		goto out;
+
+	s_us = prev_us = usec();
+	prev_works = sum_live_works(bench);
+	for (i = 0; i < bench->ncpu; ++i)
+		live_works[i] = bench->workers[i].live_works;
+	for (n = 0; !bench->stop; ++n) {
+		usleep(bench->sample_msecs * 1000);
+		now_us = usec();
+		works = sum_live_works(bench);
+		tput[n % CONVERGE_WINDOW] =
+			(works - prev_works) * 1000000.0 / (now_us - prev_us);
+		if (ts)
+			print_ts(bench, ts, now_us - s_us,
+				 works - prev_works, live_works);
+		prev_works = works;
+		prev_us = now_us;
+
+		/* end of warm-up: start profiling, then measurement; the
+		 * profiler start-up stays out of the measured window since
+		 * workers measure for the full duration from the boundary */
+		if (bench->warmup && !bench->warmup_done &&
+		    now_us - s_us >= bench->warmup * 1000000ULL) {
+			if (bench->profile_start_cmd[0])
+				system(bench->profile_start_cmd);
+			warm_us = usec();
+			bench->warmup_done = 1;
+			wmb();
+		}
+
+		/* stop early if throughput of the recent window converged */
+		if (bench->converge > 0.0 &&
+		    (!bench->warmup || bench->warmup_done) &&
+		    n + 1 >= CONVERGE_WINDOW &&
+		    now_us - (bench->warmup ? warm_us : s_us) >=
+		    bench->min_duration * 1000000ULL &&
+		    is_converged(tput, CONVERGE_WINDOW, bench->converge))
+			bench->stop = 1;
+	}
+out:
+	if (ts)
+		fclose(ts);
+}
+
+static pid_t start_sampler(struct bench *bench)
+{
+	pid_t p;
+
+	if (bench->converge <= 0.0 && !bench->ts_file[0] && !bench->warmup)
+		return 0;
+	if (!bench->sample_msecs)
+		bench->sample_msecs = SAMPLE_MSECS_DEFAULT;
+	p = fork();
+	if (!p) {
+		sampler_main(bench);
+		exit(0);
+	}
+	return p;
+}
+
+static void wait_workers(struct bench *bench)
 {
         int i;
         for (i = 0; i < bench->ncpu; i++) {
@@ -168,7 +394,10 @@ static void wait(struct bench *bench)
 
 void run_bench(struct bench *bench)
 {
+        pid_t sampler;
         int i;
+
+	sampler = start_sampler(bench);
 	for (i = 1; i < bench->ncpu; ++i) {
 		/**
 		 * fork() is intentionally used instead of pthread
@@ -184,7 +413,134 @@ void run_bench(struct bench *bench)
 		}
 	}
 	worker_main(&bench->workers[0]);
-	wait(bench);
+	wait_workers(bench);
+	if (sampler > 0) {
+		bench->stop = 1;
+		waitpid(sampler, NULL, 0);
+	}
+}
+
+static uint64_t lat_percentile(uint64_t *hist, uint64_t count, double pct)
+{
+	uint64_t target = (uint64_t)(count * pct / 100.0), cum = 0;
+	int b;
+
+	for (b = 0; b < LAT_NBUCKETS - 1; ++b) {
+		cum += hist[b];
+		if (cum > target)
+			break;
+	}
+	/* middle of the bucket */
+	return (lat_bucket_value(b) + lat_bucket_value(b + 1)) / 2;
+}
+
+static void report_latency(struct bench *bench, char *name, char *data,
+			   size_t len)
+{
+	static uint64_t hist[LAT_NBUCKETS];
+	uint64_t count = 0, max = 0, clocks = 0, usecs = 0;
+	double cycles_per_usec;
+	int i, b;
+
+	/* merge histograms of foreground workers */
+	for (i = 0; i < bench->ncpu; ++i) {
+		struct worker *w = &bench->workers[i];
+		if (w->is_bg) continue;
+		for (b = 0; b < LAT_NBUCKETS; ++b) {
+			hist[b] += w->lat_hist[b];
+			count += w->lat_hist[b];
+		}
+		if (w->lat_max > max)
+			max = w->lat_max;
+		clocks += w->clocks;
+		usecs += w->usecs;
+	}
+	if (!count || !usecs)
+		return;
+	cycles_per_usec = (double)clocks / (double)usecs;
+
+	snprintf(name, len, "lat.p50.usecs lat.p99.usecs lat.p999.usecs "
+		 "lat.max.usecs ");
+	snprintf(data, len, "%f %f %f %f ",
+		 lat_percentile(hist, count, 50.0) / cycles_per_usec,
+		 lat_percentile(hist, count, 99.0) / cycles_per_usec,
+		 lat_percentile(hist, count, 99.9) / cycles_per_usec,
+		 max / cycles_per_usec);
+}
+
+static double worker_works_per_sec(struct worker *w)
+{
+	return w->usecs ? w->works * 1000000.0 / w->usecs : 0.0;
+}
+
+static void report_fairness(struct bench *bench, FILE *out)
+{
+	double wps, sum = 0.0, sum_sq = 0.0, min = 0.0, max = 0.0;
+	double mean, stddev = 0.0, cv = 0.0, jain = 0.0;
+	int i, n = 0;
+
+	for (i = 0; i < bench->ncpu; ++i) {
+		struct worker *w = &bench->workers[i];
+		if (w->is_bg) continue;
+		wps = worker_works_per_sec(w);
+		if (!n || wps < min)
+			min = wps;
+		if (!n || wps > max)
+			max = wps;
+		sum += wps;
+		sum_sq += wps * wps;
+		++n;
+	}
+	if (!n)
+		return;
+	mean = sum / n;
+	if (n > 1 && sum_sq > n * mean * mean)
+		stddev = sqrt((sum_sq - n * mean * mean) / (n - 1));
+	if (mean > 0.0)
+		cv = stddev / mean;
+	/* Jain's fairness index: 1 (fair) ... 1/n (one worker gets all) */
+	if (sum_sq > 0.0)
+		jain = (sum * sum) / (n * sum_sq);
+
+	fprintf(out, "# worker.works/sec.min worker.works/sec.max "
+		"worker.works/sec.stddev worker.cv jain.index");
+	for (i = 0; i < bench->ncpu; ++i) {
+		struct worker *w = &bench->workers[i];
+		if (w->is_bg) continue;
+		fprintf(out, " w%d.works/sec", w->id);
+	}
+	fprintf(out, "\n%f %f %f %f %f", min, max, stddev, cv, jain);
+	for (i = 0; i < bench->ncpu; ++i) {
+		struct worker *w = &bench->workers[i];
+		if (w->is_bg) continue;
+		fprintf(out, " %f", worker_works_per_sec(w));
+	}
+	fprintf(out, "\n");
+}
+
+static void report_rusage(struct bench *bench, double works, FILE *out)
+{
+	struct worker_rusage sum;
+	uint64_t *v = (uint64_t *)&sum;
+	int i, j;
+
+	memset(&sum, 0, sizeof(sum));
+	for (i = 0; i < bench->ncpu; ++i) {
+		struct worker *w = &bench->workers[i];
+		uint64_t *wv = (uint64_t *)&w->ru;
+		if (w->is_bg) continue;
+		for (j = 0; j < sizeof(sum) / sizeof(uint64_t); ++j)
+			v[j] += wv[j];
+	}
+	if (works <= 0.0)
+		works = 1.0;
+
+	fprintf(out, "# usr.usecs sys.usecs vcsw ivcsw minflt majflt "
+		"migrations runq.usecs sys.usecs/op csw/op\n");
+	fprintf(out, "%lu %lu %lu %lu %lu %lu %lu %lu %f %f\n",
+		sum.utime_us, sum.stime_us, sum.nvcsw, sum.nivcsw,
+		sum.minflt, sum.majflt, sum.migrations, sum.runq_us,
+		sum.stime_us / works, (sum.nvcsw + sum.nivcsw) / works);
 }
 
 void report_bench(struct bench *bench, FILE *out)
@@ -194,6 +550,7 @@ void report_bench(struct bench *bench, FILE *out)
         double   total_works = 0.0;
         double   avg_secs;
 	char *profile_name, *profile_data;
+	char lat_name[128] = "", lat_data[128] = "";
         int i, n_fg_cpu;
 
         /* if report_bench is overloaded */ 
@@ -212,6 +569,10 @@ void report_bench(struct bench *bench, FILE *out)
 	n_fg_cpu = bench->ncpu - bench->nbg;
         avg_secs = (double)total_usecs/(double)n_fg_cpu/1000000.0;
 
+	/* get latency percentiles */
+	if (bench->latency)
+		report_latency(bench, lat_name, lat_data, sizeof(lat_name));
+
 	/* get profiling result */ 
 	profile_name = profile_data = empty_str;
 	if (bench->profile_stat_file[0]) {
@@ -226,9 +587,17 @@ void report_bench(struct bench *bench, FILE *out)
 		}
 	}
 
-        fprintf(out, "# ncpu secs works works/sec %s\n", profile_name);
-        fprintf(out, "%d %f %f %f %s\n", 
-                n_fg_cpu, avg_secs, total_works, total_works/avg_secs, profile_data);
+        fprintf(out, "# ncpu secs works works/sec %s%s\n",
+                lat_name, profile_name);
+        fprintf(out, "%d %f %f %f %s%s\n", 
+                n_fg_cpu, avg_secs, total_works, total_works/avg_secs,
+                lat_data, profile_data);
+
+	/* per-worker throughput and its imbalance */
+	report_fairness(bench, out);
+
+	/* cpu and scheduling accounting of workers */
+	report_rusage(bench, total_works, out);
 
 	if (profile_name != empty_str)
 		free(profile_name);
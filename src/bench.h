@@ -4,6 +4,7 @@
 #include <stdint.h>
 #include <stdio.h>
 #include <linux/limits.h>
+#include "rdtsc.h"
 
 /* architecture dependent configuration */ 
 #define PAGE_SIZE 4096
@@ -15,9 +16,30 @@
 #define BENCH_PROFILE_CMD_BYTES (PATH_MAX * 2)
 #define WORKER_MAX_PRIVATE 4
 
+/**
+ * log-bucketed latency histogram (in cycles)
+ * - values below 2^LAT_SUB_BITS have their own buckets, and
+ *   each power of two above is split into 2^LAT_SUB_BITS buckets
+ *   (i.e., relative error < 1/2^LAT_SUB_BITS)
+ */
+#define LAT_SUB_BITS 4
+#define LAT_NBUCKETS ((64 - LAT_SUB_BITS + 1) << LAT_SUB_BITS)
+
 struct bench;
 struct worker;
 
+/* cpu and scheduling accounting of a worker process */
+struct worker_rusage {
+	uint64_t utime_us;
+	uint64_t stime_us;
+	uint64_t nvcsw;		/* voluntary context switches */
+	uint64_t nivcsw;	/* involuntary context switches */
+	uint64_t minflt;
+	uint64_t majflt;
+	uint64_t migrations;	/* needs CONFIG_SCHED_DEBUG */
+	uint64_t runq_us;	/* time waiting on a runqueue */
+};
+
 struct bench_operations {
 	void (*report_bench)(struct bench *bench, FILE *out);
 	int (*pre_work)(struct worker*);
@@ -28,16 +50,23 @@ struct bench_operations {
 struct bench {
 	volatile int start;
 	volatile int stop;
+	volatile int warmup_done;
 
 	int ncpu;
 	int nbg;
 	unsigned int duration;
+	unsigned int warmup;		/* seconds excluded from results */
+	unsigned int min_duration;	/* for convergence mode */
+	double   converge;		/* stop when rel. 95% CI <= converge */
+	unsigned int sample_msecs;	/* sampling interval */
+	int	latency;		/* record latency histograms */
 	int	directio;
 	struct worker *workers; 
 	struct bench_operations ops;
 	char profile_start_cmd[BENCH_PROFILE_CMD_BYTES];
 	char profile_stop_cmd[BENCH_PROFILE_CMD_BYTES];
 	char profile_stat_file[PATH_MAX];
+	char ts_file[PATH_MAX];		/* time series of works */
 	char args[BENCH_ARG_BYTES];
 } CACHELINE_ALIGNED;
 
@@ -52,11 +81,74 @@ struct worker {
 	volatile uint64_t clocks; 
 	volatile uint64_t usecs;
 	volatile double   works;
+	volatile uint64_t live_works;	/* works so far for sampler */
+
+	uint64_t lat_prev;		/* tsc at the previous operation */
+	uint64_t lat_max;
+	uint64_t lat_hist[LAT_NBUCKETS];
+
+	uint64_t warm_works;		/* snapshot at the end of warm-up */
+	uint64_t warm_clk;
+	uint64_t warm_us;
+
+	struct worker_rusage ru_start;
+	struct worker_rusage ru;	/* during the measured window */
 
 	uint64_t private[WORKER_MAX_PRIVATE];
 	char *page;		/*private data buffer*/
 } CACHELINE_ALIGNED;
 
+static inline int lat_bucket(uint64_t v)
+{
+	int msb;
+
+	if (v < (1 << LAT_SUB_BITS))
+		return (int)v;
+	msb = 63 - __builtin_clzll(v);
+	return ((msb - LAT_SUB_BITS + 1) << LAT_SUB_BITS) |
+		(int)((v >> (msb - LAT_SUB_BITS)) & ((1 << LAT_SUB_BITS) - 1));
+}
+
+static inline uint64_t lat_bucket_value(int b)
+{
+	int exp = b >> LAT_SUB_BITS;
+	uint64_t sub = b & ((1 << LAT_SUB_BITS) - 1);
+
+	if (!exp)
+		return sub;
+	return (sub | (1 << LAT_SUB_BITS)) << (exp - 1);
+}
+
+/* latency of an operation is the time between two loop conditions */
+static inline void worker_lat_record(struct worker *worker)
+{
+	uint64_t now = rdtsc(), lat;
+
+	if (worker->lat_prev) {
+		lat = now - worker->lat_prev;
+		worker->lat_hist[lat_bucket(lat)]++;
+		if (lat > worker->lat_max)
+			worker->lat_max = lat;
+	}
+	worker->lat_prev = now;
+}
+
+void worker_end_warmup(struct worker *worker, uint64_t works);
+
+/**
+ * Loop condition of main_work: publish the number of works done
+ * so far and check if the benchmark should go on.
+ */
+static inline int bench_running(struct worker *worker, uint64_t works)
+{
+	worker->live_works = works;
+	if (worker->bench->warmup_done && !worker->warm_us)
+		worker_end_warmup(worker, works);
+	if (worker->bench->latency)
+		worker_lat_record(worker);
+	return !worker->bench->stop;
+}
+
 struct bench *alloc_bench(int ncpu, int nbg);
 void run_bench(struct bench *bench);
 void report_bench(struct bench *bench, FILE *out);
@@ -109,6 +109,12 @@ static int parse_option(int argc, char *argv[], struct cmd_opt *opt)
 		{"ncore",     required_argument, 0, 'n'}, 
 		{"nbg",       required_argument, 0, 'g'}, 
 		{"duration",  required_argument, 0, 'd'}, 
+		{"minduration", required_argument, 0, 'm'},
+		{"converge",  required_argument, 0, 'c'},
+		{"interval",  required_argument, 0, 'i'},
+		{"tslog",     required_argument, 0, 's'},
+		{"latency",   required_argument, 0, 'L'},
+		{"warmup",    required_argument, 0, 'w'},
 		{"directio",  required_argument, 0, 'D'}, 
 		{"root",      required_argument, 0, 'r'}, 
 		{"profbegin", required_argument, 0, 'b'},
@@ -121,10 +127,11 @@ static int parse_option(int argc, char *argv[], struct cmd_opt *opt)
 	opt->profile_start_cmd = "";
 	opt->profile_stop_cmd  = "";
 	opt->profile_stat_file = "";
+	opt->ts_file = "";
 	for(arg_cnt = 0; 1; ++arg_cnt) {
 		int c, idx = 0;
 		c = getopt_long(argc, argv, 
-				"t:n:g:d:D:r:b:e:l:", options, &idx);
+				"t:n:g:d:w:m:c:i:s:L:D:r:b:e:l:", options, &idx);
 		if (c == -1)
 			break; 
 		switch(c) {
@@ -142,6 +149,24 @@ static int parse_option(int argc, char *argv[], struct cmd_opt *opt)
 		case 'd':
 			opt->duration = atoi(optarg);
 			break;
+		case 'm':
+			opt->min_duration = atoi(optarg);
+			break;
+		case 'c':
+			opt->converge = atof(optarg);
+			break;
+		case 'i':
+			opt->sample_msecs = atoi(optarg);
+			break;
+		case 's':
+			opt->ts_file = optarg;
+			break;
+		case 'L':
+			opt->latency = atoi(optarg);
+			break;
+		case 'w':
+			opt->warmup = atoi(optarg);
+			break;
 		case 'D':
 			opt->directio = atoi(optarg);
 #if 0	/*optional debug*/
@@ -180,6 +205,13 @@ static void usage(FILE *out)
 	fprintf(out, "  --ncore     = number of core\n");
 	fprintf(out, "  --nbg       = number of background worker\n");
 	fprintf(out, "  --duration  = duration in seconds\n");
+	fprintf(out, "  --warmup    = warm-up in seconds before duration, excluded from results\n");
+	fprintf(out, "  --converge  = stop before duration when relative 95%% CI of\n"
+		"                throughput is within this (e.g., 0.02), 0-disable\n");
+	fprintf(out, "  --minduration = minimum duration in seconds with --converge\n");
+	fprintf(out, "  --interval  = sampling interval in msecs (default: 100)\n");
+	fprintf(out, "  --tslog     = time series log file of works per interval\n");
+	fprintf(out, "  --latency   = record per-operation latency : 0-false, 1-true\n");
 	fprintf(out, "  --directio  = file flag set O_DIRECT : 0-false, 1-true\n"
 		"                                         (only valid for DWxx type)\n");
 	fprintf(out, "  --root      = test root directory\n");
@@ -193,6 +225,12 @@ static void init_bench(struct bench *bench, struct cmd_opt *opt)
 	struct fx_opt *fx_opt = fx_opt_bench(bench);
 
 	bench->duration = opt->duration;
+	bench->warmup = opt->warmup;
+	bench->min_duration = opt->min_duration;
+	bench->converge = opt->converge;
+	bench->sample_msecs = opt->sample_msecs;
+	bench->latency = opt->latency;
+	strncpy(bench->ts_file, opt->ts_file, PATH_MAX);
 	bench->directio = opt->directio;
 	strncpy(bench->profile_start_cmd,
 		opt->profile_start_cmd, BENCH_PROFILE_CMD_BYTES);
@@ -24,6 +24,12 @@ struct cmd_opt {
 	char *profile_start_cmd;
 	char *profile_stop_cmd;
 	char *profile_stat_file;
+	int min_duration;
+	double converge;
+	int sample_msecs;
+	char *ts_file;
+	int latency;
+	int warmup;
 };
 
 /* benchmarks */ 